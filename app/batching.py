@@ -0,0 +1,94 @@
+"""
+查询批处理模块
+
+大量短序列任务针对相同的 (工具, 数据库, 参数) 时，
+提交接口先把任务放入 Redis 中的批次队列，由 run_batch 任务在等待窗口结束
+或批次已满时一次取出，把各任务的查询拼接为一个多序列 FASTA 只比对一次，
+再按序列名前缀把命中拆分回各自的任务，分摊进程启动与索引加载的开销。
+"""
+import hashlib
+import json
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from redis_client import get_redis
+from result_cache import NON_RESULT_OPTIONS, HIT_FILTER_OPTIONS
+
+# 单个批次最多合并的任务数，<= 1 时关闭批处理
+BATCH_MAX_JOBS = int(os.getenv("BATCH_MAX_JOBS", "20"))
+# 第一个任务入队后最多等待的时间 (毫秒)
+BATCH_WINDOW_MS = int(os.getenv("BATCH_WINDOW_MS", "500"))
+# 可参与批处理的查询文件大小上限 (KB)
+BATCH_MAX_QUERY_KB = int(os.getenv("BATCH_MAX_QUERY_KB", "64"))
+# 已调度 run_batch 的标记有效期 (秒)，调度消息丢失 (如 worker 重启) 时，过期后的下一次提交重新调度
+BATCH_FLUSH_TIMEOUT = int(os.getenv("BATCH_FLUSH_TIMEOUT", "60"))
+
+# 批次内查询序列名的前缀，形如 bq3_<原序列名>
+_TAG_PATTERN = re.compile(r"^bq(\d+)_")
+
+
+def batching_enabled() -> bool:
+    return BATCH_MAX_JOBS > 1 and get_redis() is not None
+
+
+def is_batchable(query_path: str) -> bool:
+    return os.path.getsize(query_path) <= BATCH_MAX_QUERY_KB * 1024
+
+
+def batch_key(tool_name: str, db_paths: List[str], options: Dict[str, Any]) -> str:
+    """相同工具、数据库、比对参数和命中过滤条件的任务共用一个批次队列"""
+    search_options = {k: v for k, v in options.items()
+                      if k not in NON_RESULT_OPTIONS or k in HIT_FILTER_OPTIONS}
+    payload = json.dumps({"tool": tool_name, "databases": db_paths, "options": search_options}, sort_keys=True)
+    return "job-batch:" + hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+def enqueue(key: str, entry: Dict[str, Any]) -> int:
+    """任务加入批次队列，返回入队后的队列长度"""
+    return get_redis().rpush(key, json.dumps(entry))
+
+
+def claim_flush(key: str) -> bool:
+    """没有已调度的 run_batch 时设置调度标记并返回 True，调用方负责调度"""
+    return bool(get_redis().set(key + ":flush", 1, nx=True, ex=BATCH_FLUSH_TIMEOUT))
+
+
+def release_flush(key: str) -> None:
+    """run_batch 开始取批次前清除调度标记，之后入队的任务会重新调度"""
+    get_redis().delete(key + ":flush")
+
+
+def take_batch(key: str) -> Tuple[List[Dict[str, Any]], int]:
+    """原子取出最多 BATCH_MAX_JOBS 个任务，返回 (任务列表, 队列剩余长度)"""
+    pipe = get_redis().pipeline(transaction=True)
+    pipe.lrange(key, 0, BATCH_MAX_JOBS - 1)
+    pipe.ltrim(key, BATCH_MAX_JOBS, -1)
+    pipe.llen(key)
+    entries, _, remaining = pipe.execute()
+    return [json.loads(e) for e in entries], remaining
+
+
+def write_batch_query(query_paths: List[str], output_path: str) -> None:
+    """拼接各任务的查询，序列名加上任务序号前缀"""
+    with open(output_path, "w") as out:
+        for index, query_path in enumerate(query_paths):
+            with open(query_path) as f:
+                has_header = False
+                for line in f:
+                    if line.startswith(">"):
+                        has_header = True
+                        line = f">bq{index}_{line[1:].lstrip()}"
+                    elif not has_header and line.strip():
+                        # 没有序列名的粘贴序列，沿用 BLAST 的默认命名
+                        out.write(f">bq{index}_Query_1\n")
+                        has_header = True
+                    out.write(line if line.endswith("\n") else line + "\n")
+
+
+def split_query_name(name: str) -> Tuple[Optional[int], str]:
+    """拆分批次序列名，返回 (任务序号, 原序列名)"""
+    match = _TAG_PATTERN.match(name)
+    if match is None:
+        return None, name
+    return int(match.group(1)), name[match.end():]
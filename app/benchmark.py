@@ -0,0 +1,353 @@
+"""
+比对流水线基准测试
+
+生成可复现的合成参考序列与查询 (或使用已有的参考 FASTA)，按工具和数据库数量
+分阶段测量索引构建、比对、结果解析与合并 (写入命中存储 + top-K) 的耗时、
+内存峰值与每秒命中数，以 JSON 输出，便于在不同提交之间对比:
+
+    cd app
+    python benchmark.py --tools blast minimap2 --databases 1 4 --output before.json
+    python benchmark.py --reference ../data/references/test_ref.fa --queries 200
+    python benchmark.py --e2e            # 通过 FastAPI 接口端到端运行 (Celery eager 模式)
+
+比对阶段与 worker 相同，经 tasks.search_databases 并行执行；合并阶段包含解析，
+与解析阶段的差值即为写入命中存储的开销。
+内存峰值: peak_rss_mb 为本阶段内本进程的峰值 (Linux 上通过 /proc/self/clear_refs 逐阶段重置)，
+child_peak_rss_mb 为截至本阶段结束所有子进程 (makeblastdb/blastn/minimap2) 中的最大值。
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager, redirect_stdout
+from typing import Any, Dict, List, Optional
+
+# 基准测试使用独立的工作目录，在导入读取环境变量的模块之前设置
+_WORK_ENV = ("RESULTS_DIR", "REF_DIR", "UPLOAD_DIR")
+
+LINE_WIDTH = 60
+BASES = "ACGT"
+
+
+def _read_peak_rss_kb() -> int:
+    """本进程内存峰值 (KB)，优先读取可重置的 VmHWM"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 以字节为单位
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def _reset_peak_rss() -> None:
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+@contextmanager
+def measure(record: Dict[str, Any]):
+    """记录代码块的墙钟时间、本进程内存峰值以及子进程 CPU 时间与内存峰值"""
+    _reset_peak_rss()
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    started = time.perf_counter()
+    yield record
+    record["seconds"] = round(time.perf_counter() - started, 4)
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    record["peak_rss_mb"] = round(_read_peak_rss_kb() / 1024, 1)
+    child_cpu = after.ru_utime + after.ru_stime - children.ru_utime - children.ru_stime
+    record["child_cpu_seconds"] = round(max(0.0, child_cpu), 4)
+    child_peak = after.ru_maxrss // 1024 if sys.platform == "darwin" else after.ru_maxrss
+    record["child_peak_rss_mb"] = round(child_peak / 1024, 1)
+    if "hits" in record:
+        record["hits_per_sec"] = round(record["hits"] / record["seconds"], 1) if record["seconds"] else None
+
+
+def write_fasta(path: str, records: List[tuple]) -> None:
+    with open(path, "w") as f:
+        for name, seq in records:
+            f.write(f">{name}\n")
+            for i in range(0, len(seq), LINE_WIDTH):
+                f.write(seq[i:i + LINE_WIDTH] + "\n")
+
+
+def random_reference(rng: random.Random, size: int, contigs: int) -> List[tuple]:
+    contig_len = max(1, size // contigs)
+    return [(f"contig{i + 1}", "".join(rng.choices(BASES, k=contig_len))) for i in range(contigs)]
+
+
+def load_reference(path: str) -> List[tuple]:
+    from fasta import iter_records
+    return [(header[1:].split()[0], "".join(l.strip() for l in lines).upper())
+            for header, lines, _ in iter_records(path) if header]
+
+
+def sample_queries(rng: random.Random, reference: List[tuple], count: int, length: int,
+                   divergence: float) -> List[tuple]:
+    """从参考序列中随机截取片段并按 divergence 引入替换突变，保证查询有真实命中"""
+    from regions import reverse_complement
+    candidates = [(name, seq) for name, seq in reference if len(seq) >= length] or reference
+    queries = []
+    for i in range(count):
+        name, seq = rng.choice(candidates)
+        start = rng.randrange(0, max(1, len(seq) - length + 1))
+        fragment = list(seq[start:start + length])
+        for pos in range(len(fragment)):
+            if rng.random() < divergence:
+                fragment[pos] = rng.choice(BASES)
+        if rng.random() < 0.5:
+            fragment = list(reverse_complement("".join(fragment)))
+        queries.append((f"q{i + 1}_{name}_{start + 1}", "".join(fragment)))
+    return queries
+
+
+def prepare_data(args, work_dir: str) -> tuple:
+    """在 REF_DIR 下写入 max(databases) 个参考库，返回 (参考库路径列表, 查询路径)"""
+    ref_dir = os.environ["REF_DIR"]
+    rng = random.Random(args.seed)
+    n_dbs = max(args.databases)
+    db_paths, references = [], []
+    for i in range(n_dbs):
+        path = os.path.join(ref_dir, f"bench_ref{i + 1}.fa")
+        if args.reference:
+            # 同一参考序列以不同库名重复使用，索引文件写在工作目录中
+            shutil.copyfile(args.reference, path)
+            if not references:
+                references = load_reference(args.reference)
+        else:
+            reference = random_reference(rng, args.ref_size, args.contigs)
+            write_fasta(path, reference)
+            references = references or reference
+        db_paths.append(path)
+
+    query_path = os.path.join(work_dir, "bench_query.fa")
+    write_fasta(query_path, sample_queries(rng, references, args.queries, args.query_length, args.divergence))
+    return db_paths, query_path
+
+
+def tool_options(args, tool_name: str) -> Dict[str, Any]:
+    options: Dict[str, Any] = {}
+    if tool_name == "blast":
+        options["task"] = args.blast_task
+    elif args.preset:
+        options["preset"] = args.preset
+    if args.threads:
+        options["threads"] = args.threads
+    return options
+
+
+def index_output(tool_name: str, db_path: str, options: Dict[str, Any]) -> str:
+    if tool_name == "blast":
+        return db_path
+    from tools.minimap2 import preset_index_path
+    return preset_index_path(db_path, options.get("preset"))
+
+
+def run_stages(args, db_paths: List[str], query_path: str) -> List[Dict[str, Any]]:
+    """逐阶段调用工具与 worker 中的函数"""
+    import fasta
+    import job_storage
+    from hit_merge import DEFAULT_SORT_BY, TopK, resolve_top_k
+    from hit_store import HitStoreWriter
+    from tasks import iter_database_hits, search_databases, tools
+
+    results = []
+    for tool_name in args.tools:
+        tool = tools[tool_name]
+        options = tool_options(args, tool_name)
+        for n_dbs in args.databases:
+            dbs = db_paths[:n_dbs]
+            for repeat in range(args.repeat):
+                base = {"mode": "stages", "tool": tool_name, "databases": n_dbs, "repeat": repeat}
+
+                record = dict(base, stage="index")
+                with measure(record):
+                    for db_path in dbs:
+                        if not tool.index(db_path, index_output(tool_name, db_path, options), options):
+                            raise RuntimeError(f"{tool_name} index failed for {db_path}")
+                results.append(record)
+
+                job_id = f"bench-{uuid.uuid4().hex[:12]}"
+                query_paths = fasta.split_fasta(query_path, job_storage.job_dir(job_id))
+                record = dict(base, stage="search", chunks=len(query_paths))
+                with measure(record):
+                    outputs = [(db_path, result_path) for db_path, _, result_path in
+                               search_databases(job_id, tool_name, query_paths, dbs, options, use_cache=False)]
+                results.append(record)
+
+                record = dict(base, stage="parse", hits=0)
+                with measure(record):
+                    for db_path, result_path in outputs:
+                        for _ in tool.iter_hits(result_path, options):
+                            record["hits"] += 1
+                results.append(record)
+
+                record = dict(base, stage="merge", hits=0)
+                hits_path = job_storage.job_file(job_id, job_storage.HITS_FILENAME)
+                with measure(record):
+                    top = TopK(resolve_top_k(options), DEFAULT_SORT_BY[tool_name])
+                    with HitStoreWriter(hits_path, tool_name) as store:
+                        for shard, (db_path, result_path) in enumerate(outputs):
+                            top.extend(store.record(iter_database_hits(tool_name, db_path, result_path, options),
+                                                    shard))
+                    record["hits"] = store.count
+                results.append(record)
+
+                shutil.rmtree(job_storage.job_dir(job_id), ignore_errors=True)
+                _report(results[-4:])
+    return results
+
+
+def run_e2e(args, db_paths: List[str], query_path: str) -> List[Dict[str, Any]]:
+    """通过 FastAPI 接口运行: 建索引、上传查询、提交任务并读取第一页命中"""
+    try:
+        from fastapi.testclient import TestClient
+    except (ImportError, RuntimeError) as e:
+        raise SystemExit(f"--e2e requires httpx for FastAPI's TestClient: {e}")
+    from tasks import celery_app
+    celery_app.conf.task_always_eager = True
+    celery_app.conf.task_store_eager_result = True
+    celery_app.conf.result_backend = "cache+memory://"
+    import main
+
+    client = TestClient(main.app)
+    results = []
+    for tool_name in args.tools:
+        options = tool_options(args, tool_name)
+        targets = {"tools": [tool_name], "presets": [options["preset"]] if options.get("preset") else None}
+        for n_dbs in args.databases:
+            db_ids = [os.path.basename(p) for p in db_paths[:n_dbs]]
+            for repeat in range(args.repeat):
+                base = {"mode": "e2e", "tool": tool_name, "databases": n_dbs, "repeat": repeat}
+
+                record = dict(base, stage="index")
+                with measure(record):
+                    for db_id in db_ids:
+                        response = client.post(f"/api/databases/{db_id}/index", json={**targets, "force": True})
+                        response.raise_for_status()
+                results.append(record)
+
+                record = dict(base, stage="upload")
+                with measure(record):
+                    with open(query_path, "rb") as f:
+                        response = client.post("/api/databases/upload", files={"file": ("bench_query.fa", f)})
+                    response.raise_for_status()
+                    filename = response.json()["filename"]
+                results.append(record)
+
+                record = dict(base, stage="job")
+                with measure(record):
+                    response = client.post("/api/jobs/", json={
+                        "tool": tool_name, "db_ids": db_ids, "query_filename": filename, "options": options,
+                    })
+                    response.raise_for_status()
+                    job_id = response.json()["job_id"]
+                    status = client.get(f"/api/jobs/{job_id}").json()
+                    if status["state"] != "SUCCESS":
+                        raise RuntimeError(f"Job {job_id} ended in {status['state']}: {status.get('status')}")
+                    record["hits"] = status["result"]["hits_count"]
+                record["job_timings"] = status["result"].get("timings")
+                results.append(record)
+
+                record = dict(base, stage="hits_page")
+                with measure(record):
+                    response = client.get(f"/api/jobs/{job_id}/hits", params={"limit": 100})
+                    response.raise_for_status()
+                results.append(record)
+                _report(results[-4:])
+    return results
+
+
+def _report(records: List[Dict[str, Any]]) -> None:
+    for r in records:
+        hits = f"{r['hits']:>9} hits {r.get('hits_per_sec') or 0:>11.1f}/s" if "hits" in r else ""
+        print(f"{r['mode']:<6} {r['tool']:<8} dbs={r['databases']:<3} {r['stage']:<9} "
+              f"{r['seconds']:>9.3f}s rss={r['peak_rss_mb']:>7.1f}MB child={r['child_peak_rss_mb']:>7.1f}MB {hits}",
+              file=sys.stderr)
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="比对流水线基准测试，结果以 JSON 输出")
+    parser.add_argument("--tools", nargs="+", default=["blast", "minimap2"], choices=["blast", "minimap2"])
+    parser.add_argument("--databases", nargs="+", type=int, default=[1], help="依次测试的数据库数量")
+    parser.add_argument("--reference", help="使用已有的参考 FASTA 代替合成序列")
+    parser.add_argument("--ref-size", type=int, default=1_000_000, help="合成参考序列总长度 (bp)")
+    parser.add_argument("--contigs", type=int, default=10, help="合成参考序列条数")
+    parser.add_argument("--queries", type=int, default=100, help="查询序列条数")
+    parser.add_argument("--query-length", type=int, default=1000, help="查询序列长度 (bp)")
+    parser.add_argument("--divergence", type=float, default=0.02, help="查询序列相对参考的替换率")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=1, help="每种组合的重复次数")
+    parser.add_argument("--threads", type=int, help="每次比对的线程数，默认与 worker 相同")
+    parser.add_argument("--blast-task", default="megablast")
+    parser.add_argument("--preset", help="minimap2 预设，如 sr、asm5、map-ont")
+    parser.add_argument("--e2e", action="store_true", help="通过 FastAPI 接口端到端运行 (Celery eager 模式)")
+    parser.add_argument("--work-dir", help="工作目录，默认使用临时目录并在结束后删除")
+    parser.add_argument("--output", help="结果 JSON 路径，默认输出到标准输出")
+    args = parser.parse_args(argv)
+    if min(args.databases) < 1:
+        parser.error("--databases must be >= 1")
+    return args
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="align-bench-")
+    for name in _WORK_ENV:
+        path = os.path.join(work_dir, name.split("_")[0].lower())
+        os.makedirs(path, exist_ok=True)
+        os.environ[name] = path
+    # 不使用 Redis 与结果缓存，每次都真实执行比对
+    os.environ.setdefault("CELERY_BROKER_URL", "memory://")
+    os.environ["RESULT_CACHE_MAX_MB"] = "0"
+
+    try:
+        db_paths, query_path = prepare_data(args, work_dir)
+        # 工具的调试输出写到标准错误，标准输出只留给 JSON 结果
+        with redirect_stdout(sys.stderr):
+            results = (run_e2e if args.e2e else run_stages)(args, db_paths, query_path)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "commit": _git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "params": {k: v for k, v in vars(args).items() if k not in ("output", "work_dir")},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
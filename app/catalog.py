@@ -0,0 +1,96 @@
+"""
+参考数据库目录模块
+
+进程内缓存数据库列表，只有参考目录或元数据配置发生变化时才重新扫描:
+- 新增、删除或重命名 FASTA 与索引文件都会改变参考目录的修改时间;
+- 元数据配置按文件修改时间判断是否变化。
+重新扫描时只调用一次 scandir，通过文件名集合判断索引是否存在，不再逐个 stat。
+网络存储的修改时间精度可能较粗，缓存最长保留 CATALOG_MAX_AGE_SECONDS 后强制重新扫描。
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from database_config import config_stamp, get_db_metadata
+from fasta import STATS_SUFFIX, load_stats
+from tools.minimap2 import PRESET_INDEX_PARAMS, preset_index_path
+
+# 缓存最长保留时间 (秒)
+CATALOG_MAX_AGE_SECONDS = float(os.getenv("CATALOG_MAX_AGE_SECONDS", "60"))
+
+FASTA_SUFFIXES = (".fa", ".fasta")
+
+# 各工具的索引文件后缀
+INDEX_SUFFIXES = {
+    "blast": ".nin",
+    "minimap2": ".mmi",
+}
+
+
+class DatabaseCatalog:
+    """参考数据库列表缓存，list() 返回 (ETag, 数据库列表)"""
+
+    def __init__(self, ref_dir: str):
+        self.ref_dir = ref_dir
+        self._lock = threading.Lock()
+        self._stamp: Optional[Tuple] = None
+        self._entries: List[Dict[str, Any]] = []
+        self._etag = ""
+        self._scanned_at = 0.0
+
+    def _current_stamp(self) -> Optional[Tuple]:
+        try:
+            dir_mtime = os.stat(self.ref_dir).st_mtime_ns
+        except OSError:
+            return None
+        return (dir_mtime, config_stamp())
+
+    def _scan(self) -> List[Dict[str, Any]]:
+        with os.scandir(self.ref_dir) as it:
+            names = {entry.name for entry in it}
+        entries = []
+        for name in sorted(names):
+            if not name.endswith(FASTA_SUFFIXES):
+                continue
+            tools = [tool for tool, suffix in INDEX_SUFFIXES.items() if name + suffix in names]
+            # 只有预设索引 (<fasta>.<preset>.mmi) 时同样可用 minimap2
+            if "minimap2" not in tools and any(preset_index_path(name, p) in names for p in PRESET_INDEX_PARAMS):
+                tools.append("minimap2")
+            metadata = get_db_metadata(name)
+            path = os.path.join(self.ref_dir, name)
+            # 统计文件由 .fai 索引阶段生成，写入时会改变目录修改时间从而触发重新扫描
+            stats = (load_stats(path) if name + STATS_SUFFIX in names else None) or {}
+            entries.append({
+                "id": name,
+                "name": name,
+                "path": path,
+                "indexed": len(tools) > 0,
+                "tools": tools,
+                "species": metadata.get("species"),
+                "genome_version": metadata.get("genome_version"),
+                "sequence_type": metadata.get("sequence_type"),
+                "description": metadata.get("description"),
+                "sequence_count": stats.get("records"),
+                "total_length": stats.get("residues"),
+                "max_length": stats.get("max_length"),
+                "n50": stats.get("n50"),
+                "gc_percent": stats.get("gc_percent"),
+            })
+        return entries
+
+    def list(self) -> Tuple[str, List[Dict[str, Any]]]:
+        stamp = self._current_stamp()
+        with self._lock:
+            if stamp is None:
+                return "", []
+            if stamp != self._stamp or time.monotonic() - self._scanned_at > CATALOG_MAX_AGE_SECONDS:
+                entries = self._scan()
+                payload = json.dumps(entries, sort_keys=True).encode()
+                self._etag = '"' + hashlib.sha1(payload).hexdigest() + '"'
+                self._entries = entries
+                self._stamp = stamp
+                self._scanned_at = time.monotonic()
+            return self._etag, self._entries
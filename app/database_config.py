@@ -2,10 +2,13 @@
 数据库元数据配置管理模块
 
 使用 YAML 文件存储数据库的物种、基因组版本、序列类型等元数据。
+解析结果按文件修改时间缓存，配置文件未变化时不重复读取。
 """
+import copy
+import threading
 import yaml
 import os
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Tuple
 
 # Default to Docker path, but allow override via ENV
 # In local development, we'll try to find it in the data directory
@@ -28,13 +31,38 @@ def get_actual_config_path() -> str:
 
 
 
+_cache_lock = threading.Lock()
+_cached_stamp: Optional[Tuple] = None
+_cached_config: Dict[str, Any] = {}
+
+
+def config_stamp() -> Optional[Tuple]:
+    """配置文件的 (路径, 修改时间, 大小)，文件不存在时返回 None"""
+    path = get_actual_config_path()
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (path, st.st_mtime_ns, st.st_size)
+
+
+def _load_cached() -> Dict[str, Any]:
+    """返回缓存的配置 (调用方不得修改)，配置文件变化时重新解析"""
+    global _cached_stamp, _cached_config
+    stamp = config_stamp()
+    with _cache_lock:
+        if stamp != _cached_stamp:
+            config = {}
+            if stamp is not None:
+                with open(stamp[0], 'r', encoding='utf-8') as f:
+                    config = yaml.safe_load(f) or {}
+            _cached_stamp, _cached_config = stamp, config
+        return _cached_config
+
+
 def load_config() -> Dict[str, Any]:
     """加载数据库配置"""
-    path = get_actual_config_path()
-    if not os.path.exists(path):
-        return {}
-    with open(path, 'r', encoding='utf-8') as f:
-        return yaml.safe_load(f) or {}
+    return copy.deepcopy(_load_cached())
 
 
 def save_config(config: Dict[str, Any]) -> None:
@@ -48,8 +76,7 @@ def save_config(config: Dict[str, Any]) -> None:
 
 def get_db_metadata(db_id: str) -> Dict[str, Any]:
     """获取单个数据库元数据"""
-    config = load_config()
-    return config.get(db_id, {})
+    return dict(_load_cached().get(db_id) or {})
 
 
 def update_db_metadata(db_id: str, metadata: Dict[str, Any]) -> None:
@@ -0,0 +1,168 @@
+"""
+参考序列索引模块
+
+流式读取一次参考 FASTA，生成与 samtools faidx 兼容的 .fai 索引
+(序列名、长度、序列起始偏移、每行碱基数、每行字节数) 以及汇总统计，
+之后可按坐标直接定位文件偏移读取任意区间，无需扫描整个文件。
+"""
+import json
+import mmap
+import os
+import uuid
+from typing import Dict, List, NamedTuple, Tuple
+
+from fasta import STATS_SUFFIX
+
+FAI_SUFFIX = ".fai"
+
+
+class FaiEntry(NamedTuple):
+    name: str
+    length: int
+    offset: int
+    line_bases: int
+    line_width: int
+
+
+class FaidxError(ValueError):
+    """参考序列格式不满足随机访问要求 (如同一序列内行长不一致)"""
+
+
+def _n50(lengths: List[int]) -> int:
+    half = sum(lengths) / 2
+    running = 0
+    for length in sorted(lengths, reverse=True):
+        running += length
+        if running >= half:
+            return length
+    return 0
+
+
+def _write_atomic(path: str, content: str) -> None:
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def build_index(fasta_path: str) -> Dict[str, int]:
+    """生成 <fasta>.fai 和 <fasta>.stats.json，返回汇总统计"""
+    entries: List[FaiEntry] = []
+    gc = 0
+    name = None
+    length = offset = line_bases = line_width = 0
+    short_line = False  # 当前序列已出现短于 line_bases 的行，之后不应再有序列行
+
+    def finish():
+        if name is not None:
+            entries.append(FaiEntry(name, length, offset, line_bases, line_width))
+
+    position = 0
+    with open(fasta_path, "rb") as f:
+        for raw in f:
+            line_start, position = position, position + len(raw)
+            if raw.startswith(b">"):
+                finish()
+                name = raw[1:].split(None, 1)[0].decode() if raw[1:].strip() else ""
+                if not name:
+                    raise FaidxError(f"Empty sequence name at byte {line_start}")
+                length = line_bases = line_width = 0
+                offset = position
+                short_line = False
+                continue
+            bases = raw.rstrip(b"\r\n")
+            if not bases:
+                # 序列中间的空行会打乱按行长计算的偏移，只允许出现在序列末尾
+                if line_bases:
+                    short_line = True
+                continue
+            if name is None:
+                raise FaidxError("Sequence data before the first header")
+            if short_line:
+                raise FaidxError(f"Inconsistent line length in sequence {name}")
+            if line_bases == 0:
+                line_bases, line_width = len(bases), len(raw)
+            elif len(bases) > line_bases or (len(bases) == line_bases and len(raw) != line_width):
+                raise FaidxError(f"Inconsistent line length in sequence {name}")
+            elif len(bases) < line_bases:
+                short_line = True
+            length += len(bases)
+            gc += bases.count(b"G") + bases.count(b"C") + bases.count(b"g") + bases.count(b"c")
+    finish()
+
+    lengths = [e.length for e in entries]
+    total = sum(lengths)
+    stats = {
+        "records": len(entries),
+        "residues": total,
+        "min_length": min(lengths) if lengths else 0,
+        "max_length": max(lengths) if lengths else 0,
+        "n50": _n50(lengths),
+        "gc_percent": round(gc / total * 100, 2) if total else 0.0,
+    }
+    _write_atomic(
+        fasta_path + FAI_SUFFIX,
+        "".join(f"{e.name}\t{e.length}\t{e.offset}\t{e.line_bases}\t{e.line_width}\n" for e in entries),
+    )
+    _write_atomic(fasta_path + STATS_SUFFIX, json.dumps(stats))
+    return stats
+
+
+def is_fresh(fasta_path: str) -> bool:
+    """.fai 与统计信息都存在且不早于 FASTA"""
+    try:
+        fasta_mtime = os.path.getmtime(fasta_path)
+        return all(os.path.getmtime(fasta_path + s) >= fasta_mtime for s in (FAI_SUFFIX, STATS_SUFFIX))
+    except OSError:
+        return False
+
+
+def read_fai(fasta_path: str) -> Dict[str, FaiEntry]:
+    """按文件顺序读取 .fai，返回 序列名 -> 索引条目"""
+    entries = {}
+    with open(fasta_path + FAI_SUFFIX) as f:
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) < 5:
+                continue
+            entries[fields[0]] = FaiEntry(fields[0], *(int(v) for v in fields[1:5]))
+    return entries
+
+
+def byte_range(entry: FaiEntry, start: int, end: int) -> Tuple[int, int]:
+    """[start, end) 区间 (0-based，已裁剪到序列范围内) 在文件中的字节范围"""
+
+    def byte_offset(pos: int) -> int:
+        return entry.offset + (pos // entry.line_bases) * entry.line_width + pos % entry.line_bases
+
+    return byte_offset(start), byte_offset(end - 1) + 1
+
+
+def _clip(entry: FaiEntry, start: int, end: int) -> Tuple[int, int]:
+    return max(0, start), min(end, entry.length)
+
+
+class FastaReader:
+    """以内存映射方式随机读取参考序列，可在多个线程间共享"""
+
+    def __init__(self, fasta_path: str):
+        self.path = fasta_path
+        self.entries = read_fai(fasta_path)
+        with open(fasta_path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def fetch(self, name: str, start: int, end: int) -> str:
+        """读取序列 name 的 [start, end) 区间，序列不存在时抛出 KeyError"""
+        entry = self.entries[name]
+        start, end = _clip(entry, start, end)
+        if start >= end:
+            return ""
+        begin, stop = byte_range(entry, start, end)
+        return self._mmap[begin:stop].replace(b"\n", b"").replace(b"\r", b"").decode()
+
+    def close(self) -> None:
+        self._mmap.close()
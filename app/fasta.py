@@ -0,0 +1,182 @@
+"""
+FASTA 文件工具模块
+
+按行流式读取，不把整个文件载入内存，适用于包含数万条 reads 的查询文件。
+"""
+import json
+import math
+import os
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# 查询总长度超过该值 (bp) 时拆分为多个分块并行比对
+QUERY_CHUNK_RESIDUES = int(os.getenv("QUERY_CHUNK_RESIDUES", "2000000"))
+# 单个查询最多拆分的分块数
+QUERY_MAX_CHUNKS = int(os.getenv("QUERY_MAX_CHUNKS", "32"))
+
+# 查询统计信息文件后缀，上传时生成，供调度和拆分直接读取
+STATS_SUFFIX = ".stats.json"
+
+# 核酸序列允许的字符 (IUPAC 简并碱基与比对空位)
+SEQUENCE_CHARS = frozenset(b"ACGTURYKMSWBDHVNacgturykmswbdhvn-")
+
+
+class FastaFormatError(ValueError):
+    """查询不是合法的核酸 FASTA"""
+
+
+class FastaValidator:
+    """增量校验 FASTA 内容并统计序列条数与长度
+
+    数据可以按任意大小分块传入，跨块的行会被拼接后再校验。
+    与 BLAST 一致，允许开头是一条没有标题行的序列。
+    """
+
+    def __init__(self):
+        self.records = 0
+        self.residues = 0
+        self.max_length = 0
+        self.line_no = 0
+        self._pending = b""
+        self._current = None  # 当前序列长度，None 表示尚未进入任何序列
+
+    def feed(self, data: bytes) -> None:
+        lines = (self._pending + data).split(b"\n")
+        self._pending = lines.pop()
+        for line in lines:
+            self._line(line)
+
+    def _line(self, line: bytes) -> None:
+        self.line_no += 1
+        line = line.rstrip(b"\r")
+        if line.startswith(b">"):
+            self._end_record()
+            if not line[1:].strip():
+                raise FastaFormatError(f"Line {self.line_no}: empty sequence header")
+            self._current = 0
+            return
+        line = line.strip()
+        if not line:
+            return
+        invalid = set(line) - SEQUENCE_CHARS
+        if invalid:
+            raise FastaFormatError(
+                f"Line {self.line_no}: invalid sequence character {chr(min(invalid))!r}"
+            )
+        if self._current is None:
+            self._current = 0
+        self._current += len(line)
+
+    def _end_record(self) -> None:
+        if self._current is None:
+            return
+        if self._current == 0:
+            raise FastaFormatError(f"Line {self.line_no}: sequence record has no residues")
+        self.records += 1
+        self.residues += self._current
+        self.max_length = max(self.max_length, self._current)
+        self._current = None
+
+    def close(self) -> Dict[str, int]:
+        """结束校验并返回统计信息"""
+        if self._pending:
+            self._line(self._pending)
+            self._pending = b""
+        self.line_no += 1
+        self._end_record()
+        if self.records == 0:
+            raise FastaFormatError("No sequences found")
+        return {"records": self.records, "residues": self.residues, "max_length": self.max_length}
+
+
+def write_stats(path: str, stats: Dict[str, Any]) -> None:
+    with open(path + STATS_SUFFIX, "w") as f:
+        json.dump(stats, f)
+
+
+def load_stats(path: str) -> Optional[Dict[str, Any]]:
+    """读取查询统计信息，文件不存在或早于查询文件时返回 None"""
+    stats_path = path + STATS_SUFFIX
+    try:
+        if os.path.getmtime(stats_path) < os.path.getmtime(path):
+            return None
+        with open(stats_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def iter_records(path: str) -> Iterator[Tuple[str, List[str], int]]:
+    """逐条产出 (标题行, 序列行列表, 序列长度)，标题行保留原样"""
+    header, lines, residues = None, [], 0
+    with open(path) as f:
+        for line in f:
+            if line.startswith(">"):
+                if header is not None or lines:
+                    yield header, lines, residues
+                header, lines, residues = line, [], 0
+            elif line.strip():
+                lines.append(line)
+                residues += len(line.strip())
+    if header is not None or lines:
+        yield header, lines, residues
+
+
+def parse_records(text: str) -> List[Tuple[str, str]]:
+    """把已校验的 FASTA 文本解析为 [(序列名, 序列)]，序列名取标题行第一个词；
+    与 BLAST 一致，没有标题行的序列命名为 Query_1"""
+    records: List[Tuple[str, List[str]]] = []
+    for line in text.splitlines():
+        if line.startswith(">"):
+            records.append((line[1:].split()[0], []))
+        elif line.strip():
+            if not records:
+                records.append(("Query_1", []))
+            records[-1][1].append(line.strip())
+    return [(name, "".join(lines)) for name, lines in records]
+
+
+def count_residues(path: str) -> Tuple[int, int]:
+    """返回 (序列条数, 总长度)，优先使用上传时记录的统计信息"""
+    stats = load_stats(path)
+    if stats is not None:
+        return stats["records"], stats["residues"]
+    records = total = 0
+    for _, _, residues in iter_records(path):
+        records += 1
+        total += residues
+    return records, total
+
+
+def split_fasta(path: str, output_dir: str, chunk_residues: int = QUERY_CHUNK_RESIDUES,
+                max_chunks: int = QUERY_MAX_CHUNKS) -> List[str]:
+    """按序列长度把查询拆分为大小均衡的分块，返回分块文件路径
+
+    总长度不超过 chunk_residues 或只有一条序列时不拆分，直接返回原文件。
+    序列保持原有顺序且不会被截断，因此按分块顺序拼接结果与不拆分时一致。
+    """
+    records, total = count_residues(path)
+    n_chunks = min(max_chunks, records, math.ceil(total / chunk_residues)) if chunk_residues > 0 else 1
+    if n_chunks <= 1:
+        return [path]
+
+    target = total / n_chunks
+    paths = []
+    out = None
+    written = 0
+    try:
+        for header, lines, residues in iter_records(path):
+            # 当前分块达到均分目标后开始下一个分块，最后一个分块容纳剩余序列
+            if out is None or (written >= target * len(paths) and len(paths) < n_chunks):
+                if out is not None:
+                    out.close()
+                paths.append(os.path.join(output_dir, f"query.part{len(paths)}.fasta"))
+                out = open(paths[-1], "w")
+            if header is not None:
+                out.write(header if header.endswith("\n") else header + "\n")
+            for line in lines:
+                out.write(line if line.endswith("\n") else line + "\n")
+            written += residues
+    finally:
+        if out is not None:
+            out.close()
+    return paths
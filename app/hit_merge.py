@@ -0,0 +1,85 @@
+"""
+命中结果合并模块
+
+多个数据库的命中流经同一个大小为 K 的堆，只保留排序最靠前的 K 个命中。
+内存占用为 O(K)，耗时为 O(n·log K)，n 为命中总数。
+"""
+import heapq
+import math
+import os
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+# 单个任务可请求的 top-K 上限
+MAX_TOP_K = int(os.getenv("MAX_TOP_K", "1000"))
+DEFAULT_TOP_K = 100
+
+
+def hit_identity(hit: Dict[str, Any]) -> float:
+    """序列一致性 (%)：BLAST 使用 pident，minimap2 使用 matches / block_len"""
+    if hit.get("pident") is not None:
+        return hit["pident"]
+    block_len = hit.get("block_len") or 0
+    return hit.get("matches", 0) / block_len * 100 if block_len else 0.0
+
+
+def _evalue(hit: Dict[str, Any]) -> float:
+    evalue = hit.get("evalue")
+    return math.inf if evalue is None else evalue
+
+
+# 排序键 -> (取值函数, 是否越大越好)
+SORT_KEYS: Dict[str, Tuple[Callable[[Dict[str, Any]], float], bool]] = {
+    "bitscore": (lambda h: h.get("bitscore") or 0, True),
+    "evalue": (_evalue, False),
+    "mapq": (lambda h: h.get("mapq") or 0, True),
+    "identity": (hit_identity, True),
+}
+
+# 各工具命中可用的排序键
+TOOL_SORT_KEYS = {
+    "blast": ("bitscore", "evalue", "identity"),
+    "minimap2": ("mapq", "identity"),
+}
+
+# 各工具默认排序键
+DEFAULT_SORT_BY = {
+    "blast": "bitscore",
+    "minimap2": "mapq",
+}
+
+
+class TopK:
+    """有界最小堆，堆顶为当前第 K 名，新命中只有优于堆顶时才入堆"""
+
+    def __init__(self, k: int, sort_by: str):
+        self.k = k
+        self.sort_by = sort_by
+        self._value, self._descending = SORT_KEYS[sort_by]
+        self._heap: List[tuple] = []
+        self.count = 0
+
+    def push(self, hit: Dict[str, Any]) -> None:
+        self.count += 1
+        if self.k <= 0:
+            return
+        value = self._value(hit)
+        score = value if self._descending else -value
+        # 分数相同时先到的命中排在前面；序号唯一，保证不会比较到 dict
+        item = (score, -self.count, hit)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, item)
+        elif item > self._heap[0]:
+            heapq.heapreplace(self._heap, item)
+
+    def extend(self, hits: Iterable[Dict[str, Any]]) -> None:
+        for hit in hits:
+            self.push(hit)
+
+    def results(self) -> List[Dict[str, Any]]:
+        """按排序键从优到劣返回保留的命中"""
+        return [hit for _, _, hit in sorted(self._heap, reverse=True)]
+
+
+def resolve_top_k(options: Dict[str, Any]) -> int:
+    return max(0, min(int(options.get("top_k", DEFAULT_TOP_K)), MAX_TOP_K))
+
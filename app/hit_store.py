@@ -0,0 +1,179 @@
+"""
+命中结果存储模块
+
+每个任务的全部命中写入任务目录下的 SQLite 文件，
+结果接口按需分页、排序和过滤读取，无需一次性加载全部命中。
+各分片 (数据库 × 查询分块) 按完成顺序写入，排序值相同时按分片序号和分片内顺序排列，
+因此结果顺序与并行完成的先后无关。
+"""
+import os
+import sqlite3
+import uuid
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from hit_merge import hit_identity, DEFAULT_SORT_BY, SORT_KEYS
+
+# 各工具命中字段及其 SQLite 类型
+HIT_FIELDS = {
+    "blast": [
+        ("qseqid", "TEXT"), ("qlen", "INTEGER"), ("sseqid", "TEXT"), ("pident", "REAL"),
+        ("length", "INTEGER"), ("mismatch", "INTEGER"), ("gapopen", "INTEGER"),
+        ("qstart", "INTEGER"), ("qend", "INTEGER"), ("sstart", "INTEGER"), ("send", "INTEGER"),
+        ("evalue", "REAL"), ("bitscore", "REAL"), ("stitle", "TEXT"),
+    ],
+    "minimap2": [
+        ("query_name", "TEXT"), ("query_len", "INTEGER"), ("query_start", "INTEGER"),
+        ("query_end", "INTEGER"), ("strand", "TEXT"), ("target_name", "TEXT"),
+        ("target_len", "INTEGER"), ("target_start", "INTEGER"), ("target_end", "INTEGER"),
+        ("matches", "INTEGER"), ("block_len", "INTEGER"), ("mapq", "INTEGER"),
+        ("nm", "INTEGER"), ("aln_score", "INTEGER"), ("tp", "TEXT"), ("divergence", "REAL"),
+        ("cigar", "TEXT"),
+    ],
+}
+
+# 各工具的查询序列名字段
+QUERY_FIELD = {
+    "blast": "qseqid",
+    "minimap2": "query_name",
+}
+
+# 建立索引的排序/过滤字段
+INDEXED_FIELDS = ["database", "identity", "bitscore", "evalue", "mapq", "qseqid", "query_name"]
+
+# 单页最多返回的命中数
+MAX_PAGE_SIZE = 1000
+
+# 批量写入的行数
+INSERT_BATCH = 10000
+
+
+def _columns(tool: str) -> List[str]:
+    return ["database", "identity"] + [name for name, _ in HIT_FIELDS[tool]]
+
+
+class HitStoreWriter:
+    """流式写入命中，完成后建立索引并原子替换为最终文件"""
+
+    def __init__(self, path: str, tool: str):
+        self.path = path
+        self.tool = tool
+        self.columns = _columns(tool)
+        self._fields = [name for name, _ in HIT_FIELDS[tool]]
+        self._tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        self._batch: List[tuple] = []
+        self.count = 0
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def __enter__(self) -> "HitStoreWriter":
+        conn = sqlite3.connect(self._tmp_path)
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        fields = ", ".join(f"{name} {sql_type}" for name, sql_type in HIT_FIELDS[self.tool])
+        conn.execute(f"CREATE TABLE hits (shard INTEGER, database TEXT, identity REAL, {fields})")
+        conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+        conn.execute("INSERT INTO meta VALUES ('tool', ?)", (self.tool,))
+        self._conn = conn
+        self._insert_sql = (f"INSERT INTO hits (shard, {', '.join(self.columns)}) "
+                            f"VALUES ({', '.join('?' * (len(self.columns) + 1))})")
+        return self
+
+    def add(self, hit: Dict[str, Any], shard: int = 0) -> None:
+        self._batch.append((shard, hit.get("database"), round(hit_identity(hit), 2), *map(hit.get, self._fields)))
+        self.count += 1
+        if len(self._batch) >= INSERT_BATCH:
+            self._flush()
+
+    def record(self, hits: Iterable[Dict[str, Any]], shard: int = 0) -> Iterator[Dict[str, Any]]:
+        """写入经过的每个命中并原样产出，便于与 top-K 合并串联"""
+        for hit in hits:
+            self.add(hit, shard)
+            yield hit
+
+    def _flush(self) -> None:
+        if self._batch:
+            self._conn.executemany(self._insert_sql, self._batch)
+            self._batch = []
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        try:
+            if exc_type is None:
+                self._flush()
+                for name in INDEXED_FIELDS:
+                    if name in self.columns:
+                        self._conn.execute(f"CREATE INDEX idx_{name} ON hits ({name})")
+                self._conn.commit()
+            self._conn.close()
+            if exc_type is None:
+                os.replace(self._tmp_path, self.path)
+        finally:
+            if os.path.exists(self._tmp_path):
+                os.remove(self._tmp_path)
+
+
+def query_hits(
+    path: str,
+    offset: int = 0,
+    limit: int = 100,
+    sort_by: Optional[str] = None,
+    order: Optional[str] = None,
+    database: Optional[str] = None,
+    qseqid: Optional[str] = None,
+    min_pident: Optional[float] = None,
+    max_evalue: Optional[float] = None,
+) -> Dict[str, Any]:
+    """按条件分页读取命中，非法的排序或过滤字段抛出 ValueError
+
+    未指定 order 时按排序字段的优劣方向排列，较好的命中在前 (evalue 升序，其余降序)。
+    """
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    try:
+        tool = conn.execute("SELECT value FROM meta WHERE key = 'tool'").fetchone()[0]
+        # 旧版本写入的结果缺少后来增加的字段，只读取实际存在的列
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(hits)")}
+        columns = [name for name in _columns(tool) if name in existing]
+
+        where, params = [], []
+        if database:
+            where.append("database = ?")
+            params.append(database)
+        if qseqid:
+            where.append(f"{QUERY_FIELD[tool]} = ?")
+            params.append(qseqid)
+        if min_pident is not None:
+            where.append("identity >= ?")
+            params.append(min_pident)
+        if max_evalue is not None:
+            if "evalue" not in columns:
+                raise ValueError(f"max_evalue is not supported for {tool} results")
+            where.append("evalue <= ?")
+            params.append(max_evalue)
+        where_sql = f"WHERE {' AND '.join(where)}" if where else ""
+
+        if sort_by is None:
+            sort_by = DEFAULT_SORT_BY[tool]
+        if sort_by not in columns:
+            raise ValueError(f"Unsupported sort_by: {sort_by}")
+        if order is None:
+            # 不在 SORT_KEYS 中的其余字段保持降序
+            order = "desc" if SORT_KEYS.get(sort_by, (None, True))[1] else "asc"
+        if order not in ("asc", "desc"):
+            raise ValueError(f"Unsupported order: {order}")
+
+        limit = max(0, min(limit, MAX_PAGE_SIZE))
+        offset = max(0, offset)
+        total = conn.execute(f"SELECT COUNT(*) FROM hits {where_sql}", params).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT {', '.join(columns)} FROM hits {where_sql} "
+            f"ORDER BY {sort_by} {order.upper()}, shard, rowid LIMIT ? OFFSET ?",
+            params + [limit, offset],
+        ).fetchall()
+        return {
+            "tool": tool,
+            "total": total,
+            "offset": offset,
+            "limit": limit,
+            "hits": [dict(row) for row in rows],
+        }
+    finally:
+        conn.close()
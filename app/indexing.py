@@ -0,0 +1,208 @@
+"""
+参考数据库索引流水线
+
+一次请求可构建多个索引目标，各目标并行执行:
+- blast: makeblastdb
+- minimap2 / minimap2:<preset>: 通用或按预设参数构建的 .mmi
+- faidx: .fai 与序列统计
+
+每个参考序列旁的 <fasta>.index.json 记录各目标构建时 FASTA 的大小、修改时间和 SHA-256，
+FASTA 未变化且索引文件齐全的目标直接跳过；修改时间变化但大小相同时比较校验和，
+仅被 touch 或复制过的文件不会触发重建。
+同一参考序列同一目标的构建通过 Redis 锁 (无 Redis 时为文件锁) 互斥，
+并发请求中后到的一方等待锁释放后发现索引已是最新而跳过。
+"""
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+import faidx
+from redis_client import get_redis
+from tools.blast import BlastTool
+from tools.minimap2 import Minimap2Tool, PRESET_INDEX_PARAMS, preset_index_path
+
+logger = logging.getLogger(__name__)
+
+INDEX_MANIFEST_SUFFIX = ".index.json"
+# 构建锁的最长持有时间 (秒)，超时后视为构建进程已退出
+INDEX_LOCK_TIMEOUT = int(os.getenv("INDEX_LOCK_TIMEOUT", str(6 * 3600)))
+
+_blast = BlastTool()
+_minimap2 = Minimap2Tool()
+
+
+class IndexTargetError(ValueError):
+    """不支持的索引目标"""
+
+
+def parse_target(target: str) -> tuple:
+    """'minimap2:sr' -> ('minimap2', 'sr')，校验工具与预设"""
+    tool, _, preset = target.partition(":")
+    if tool not in ("blast", "minimap2", "faidx"):
+        raise IndexTargetError(f"Unsupported index tool: {tool}")
+    if preset and (tool != "minimap2" or preset not in PRESET_INDEX_PARAMS):
+        raise IndexTargetError(f"Unsupported index preset: {target}")
+    return tool, preset or None
+
+
+def target_files(fasta_path: str, target: str) -> List[str]:
+    """判断目标是否已构建时需要存在的文件"""
+    tool, preset = parse_target(target)
+    if tool == "blast":
+        # 大库由 makeblastdb 拆分为多卷，以 .nal 为入口
+        if os.path.exists(fasta_path + ".nal"):
+            return [fasta_path + ".nal"]
+        return [fasta_path + s for s in (".nin", ".nhr", ".nsq")]
+    if tool == "minimap2":
+        return [preset_index_path(fasta_path, preset)]
+    return [fasta_path + faidx.FAI_SUFFIX, fasta_path + faidx.STATS_SUFFIX]
+
+
+def file_checksum(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def fasta_identity(fasta_path: str) -> Dict[str, int]:
+    st = os.stat(fasta_path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+@contextmanager
+def _locked_manifest(fasta_path: str):
+    """独占读写索引清单"""
+    with open(fasta_path + INDEX_MANIFEST_SUFFIX, "a+") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            f.seek(0)
+            content = f.read()
+            manifest = json.loads(content) if content else {}
+            yield manifest
+            f.seek(0)
+            f.truncate()
+            json.dump(manifest, f, indent=2)
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def load_manifest(fasta_path: str) -> Dict[str, Any]:
+    """读取索引清单，加共享锁避免读到其他目标正在重写的文件"""
+    try:
+        with open(fasta_path + INDEX_MANIFEST_SUFFIX) as f:
+            fcntl.flock(f, fcntl.LOCK_SH)
+            try:
+                return json.load(f)
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+    except (OSError, ValueError):
+        return {}
+
+
+def is_up_to_date(fasta_path: str, target: str) -> bool:
+    """索引文件齐全且 FASTA 与构建时一致"""
+    entry = load_manifest(fasta_path).get(target)
+    if not entry or not all(os.path.exists(p) for p in target_files(fasta_path, target)):
+        return False
+    current = fasta_identity(fasta_path)
+    if current["size"] != entry.get("size"):
+        return False
+    if current["mtime_ns"] == entry.get("mtime_ns"):
+        return True
+    # 修改时间变化但大小相同，比较内容；一致时更新记录的修改时间，下次直接命中
+    if entry.get("sha256") and file_checksum(fasta_path) == entry["sha256"]:
+        # 搜索时按 "索引不早于 FASTA" 判断索引可用，同步刷新索引文件的修改时间
+        for path in target_files(fasta_path, target):
+            os.utime(path)
+        with _locked_manifest(fasta_path) as manifest:
+            manifest.setdefault(target, entry)["mtime_ns"] = current["mtime_ns"]
+        return True
+    return False
+
+
+@contextmanager
+def build_lock(fasta_path: str, target: str):
+    """同一参考序列同一目标的构建互斥，跨 worker 使用 Redis 锁"""
+    client = get_redis()
+    if client is not None:
+        with client.lock(f"index-lock:{fasta_path}:{target}", timeout=INDEX_LOCK_TIMEOUT):
+            yield
+        return
+    lock_path = f"{fasta_path}.{target.replace(':', '_')}.lock"
+    with open(lock_path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _build(fasta_path: str, target: str) -> bool:
+    tool, preset = parse_target(target)
+    if tool == "blast":
+        return _blast.index(fasta_path, fasta_path)
+    if tool == "minimap2":
+        return _minimap2.index(fasta_path, preset_index_path(fasta_path, preset), {"preset": preset})
+    try:
+        faidx.build_index(fasta_path)
+        return True
+    except faidx.FaidxError as e:
+        logger.warning(f"Cannot build .fai for {fasta_path}: {e}")
+        return False
+
+
+def build_target(fasta_path: str, target: str, force: bool = False) -> str:
+    """构建单个目标，返回 'skipped' / 'finished' / 'failed'"""
+    with build_lock(fasta_path, target):
+        if not force and is_up_to_date(fasta_path, target):
+            return "skipped"
+        # 先记录构建开始时的 FASTA 状态，构建期间文件被修改时下次检查会判定为过期
+        identity = fasta_identity(fasta_path)
+        started = time.perf_counter()
+        if not _build(fasta_path, target):
+            return "failed"
+        identity["sha256"] = file_checksum(fasta_path)
+        identity["seconds"] = round(time.perf_counter() - started, 3)
+        identity["built_at"] = time.time()
+        with _locked_manifest(fasta_path) as manifest:
+            manifest[target] = identity
+        return "finished"
+
+
+def build_indexes(fasta_path: str, targets: List[str], force: bool = False,
+                  on_progress: Optional[Callable[[Dict[str, str]], None]] = None) -> Dict[str, str]:
+    """并行构建多个目标，每个目标状态变化时回调 on_progress(状态表)，返回最终状态表"""
+    for target in targets:
+        parse_target(target)
+    states = {target: "pending" for target in targets}
+    lock = threading.Lock()
+
+    def report(target: str, state: str) -> None:
+        with lock:
+            states[target] = state
+            if on_progress:
+                on_progress(dict(states))
+
+    def run(target: str) -> str:
+        report(target, "running")
+        return build_target(fasta_path, target, force)
+
+    with ThreadPoolExecutor(max_workers=max(1, len(targets))) as pool:
+        futures = {pool.submit(run, target): target for target in targets}
+        for future in as_completed(futures):
+            target = futures[future]
+            try:
+                report(target, future.result())
+            except Exception as e:
+                logger.error(f"Index build {target} for {fasta_path} failed: {e}")
+                report(target, "failed")
+    return states
@@ -0,0 +1,103 @@
+"""
+任务结果文件管理模块
+
+每个任务在 RESULTS_DIR 下拥有以任务 ID 命名的独立工作目录，
+各数据库的比对结果写入 `<任务目录>/<数据库名><后缀>`，
+先写入临时文件再原子重命名，因此目录中出现的结果文件总是完整的。
+"""
+import json
+import os
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+# Default to Docker path, with local fallback
+RESULTS_DIR = os.getenv("RESULTS_DIR", "/data/results")
+if not os.path.exists(RESULTS_DIR):
+    RESULTS_DIR = "data/results"
+
+
+# 任务目录保留时长 (小时)，超过该时长未使用的任务目录由定期清理任务删除 (见 retention 模块)
+JOB_RETENTION_HOURS = float(os.getenv("JOB_RETENTION_HOURS", "72"))
+
+# 任务全部命中的存储文件名
+HITS_FILENAME = "hits.sqlite"
+# 任务清单文件名
+MANIFEST_FILENAME = "manifest.json"
+# 记录任务查询文件路径的文件名
+QUERY_REF_FILENAME = "query.ref"
+
+
+def job_file(job_id: str, name: str) -> str:
+    """任务目录下的文件路径 (不创建目录)，拒绝包含路径分隔符的任务 ID"""
+    if not job_id or os.path.basename(job_id) != job_id or job_id in (".", ".."):
+        raise ValueError(f"Invalid job id: {job_id}")
+    return os.path.join(RESULTS_DIR, job_id, name)
+
+
+def job_dir(job_id: str) -> str:
+    """返回任务工作目录，不存在时创建"""
+    path = os.path.join(RESULTS_DIR, job_id)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def result_path(job_id: str, db_path: str, suffix: str) -> str:
+    """单个数据库比对结果文件路径"""
+    return os.path.join(job_dir(job_id), os.path.basename(db_path) + suffix)
+
+
+@contextmanager
+def atomic_output(path: str):
+    """产出临时文件路径，正常退出后原子替换为目标文件，异常时删除临时文件"""
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def write_manifest(job_id: str, manifest: Dict[str, Any]) -> str:
+    """原子写入任务清单，返回清单路径"""
+    path = os.path.join(job_dir(job_id), MANIFEST_FILENAME)
+    with atomic_output(path) as tmp_path:
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+    return path
+
+
+def load_manifest(job_id: str) -> Optional[Dict[str, Any]]:
+    """读取任务清单，不存在或任务 ID 非法时返回 None"""
+    try:
+        path = job_file(job_id, MANIFEST_FILENAME)
+    except ValueError:
+        return None
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def record_query(job_id: str, query_path: str) -> None:
+    """记录任务的查询文件路径，供保留策略判断上传文件是否仍被任务使用"""
+    with open(os.path.join(job_dir(job_id), QUERY_REF_FILENAME), "w") as f:
+        f.write(query_path)
+
+
+def load_query(job_id: str) -> Optional[str]:
+    """任务记录的查询文件路径，没有记录时返回 None"""
+    try:
+        with open(job_file(job_id, QUERY_REF_FILENAME)) as f:
+            return f.read().strip() or None
+    except (OSError, ValueError):
+        return None
+
+
+def touch(job_id: str) -> None:
+    """更新任务目录的修改时间，作为保留策略的最近使用时间"""
+    try:
+        os.utime(job_file(job_id, ""))
+    except (OSError, ValueError):
+        pass
@@ -0,0 +1,413 @@
+"""
+HTTP 接口与任务队列压力测试
+
+在本进程内启动 uvicorn 服务与 Celery worker (默认内存 broker，比对工具替换为按固定耗时生成合成结果的假工具)，
+模拟 N 个并发用户上传查询、提交任务、轮询状态并读取命中，输出吞吐量、各接口 p50/p99 延迟
+与队列深度随时间的变化，以 JSON 输出，便于在不同提交或部署参数之间对比:
+
+    cd app
+    python loadtest.py --users 50 --duration 60 --output load.json
+    python loadtest.py --users 20 --search-ms 2000 --worker-concurrency 4
+    python loadtest.py --broker redis://localhost:6379/15      # 本地 Redis: 覆盖进度推送与批处理路径
+    python loadtest.py --url http://staging:8000 --db-ids ref.fa   # 只压测已部署服务的 HTTP 接口
+
+需要 httpx。--url 模式下不启动本地服务与 worker，给出 --broker 时仍可采样该 broker 的队列深度。
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager, redirect_stdout
+from typing import Any, Dict, List, Optional
+
+from benchmark import BASES, _git_commit, random_reference, sample_queries, write_fasta
+
+# 压力测试使用独立的工作目录，在导入读取环境变量的模块之前设置
+_WORK_ENV = ("RESULTS_DIR", "REF_DIR", "UPLOAD_DIR")
+
+TERMINAL_STATES = ("SUCCESS", "FAILURE", "REVOKED")
+SUBMIT = "POST /api/jobs/"
+
+
+class Recorder:
+    """线程安全地记录各接口的请求延迟、任务结果与队列深度采样"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests: Dict[str, List[tuple]] = defaultdict(list)  # 接口 -> [(延迟秒, 是否成功)]
+        self.jobs: List[Dict[str, Any]] = []
+        self.samples: List[Dict[str, Any]] = []
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.submitted = 0
+
+    def request(self, endpoint: str, seconds: float, ok: bool, error: Optional[str] = None) -> None:
+        with self._lock:
+            self.requests[endpoint].append((seconds, ok))
+            if error:
+                self.errors[f"{endpoint}: {error}"] += 1
+            elif endpoint == SUBMIT:
+                self.submitted += 1
+
+    def job(self, record: Dict[str, Any]) -> None:
+        with self._lock:
+            self.jobs.append(record)
+
+    def sample(self, record: Dict[str, Any]) -> None:
+        with self._lock:
+            self.samples.append(record)
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """最近秩百分位数"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def latency_summary(seconds: List[float]) -> Dict[str, Any]:
+    ms = [s * 1000 for s in seconds]
+    return {
+        "p50_ms": _round(percentile(ms, 50)),
+        "p90_ms": _round(percentile(ms, 90)),
+        "p99_ms": _round(percentile(ms, 99)),
+        "max_ms": _round(max(ms, default=None)),
+        "mean_ms": _round(sum(ms) / len(ms) if ms else None),
+    }
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return None if value is None else round(value, 2)
+
+
+def fake_tool(base_cls, search_seconds: float, hits_per_query: int):
+    """替换外部比对程序的假工具: 等待 search_seconds 后为每条查询写出 hits_per_query 个合成命中
+
+    输出格式与真实工具一致，解析、合并与命中存储仍走正常流程。
+    """
+    from fasta import iter_records
+    from tools.blast import OUTFMT_COLUMNS
+
+    class FakeTool(base_cls):
+        def index(self, fasta_path, output_path, options=None):
+            return True
+
+        def search(self, query_path, db_path, options, output_path):
+            time.sleep(search_seconds)
+            with open(output_path, "w") as out:
+                for header, _, length in iter_records(query_path):
+                    name = header[1:].split()[0] if header else "Query_1"
+                    for i in range(hits_per_query):
+                        end = max(1, length - i)
+                        if self.result_suffix.endswith(".paf"):
+                            out.write(f"{name}\t{length}\t0\t{end}\t+\tcontig1\t{length * 10}\t{i}\t{i + end}\t"
+                                      f"{end - i}\t{end}\t{60 - i % 60}\tNM:i:{i}\tAS:i:{end}\ttp:A:P\n")
+                        else:
+                            row = {"qseqid": name, "qlen": length, "sseqid": "contig1", "pident": 100.0 - i % 10,
+                                   "length": end, "mismatch": i, "gapopen": 0, "qstart": 1, "qend": end,
+                                   "sstart": i + 1, "send": i + end, "evalue": 1e-50 * (i + 1),
+                                   "bitscore": float(end * 2), "stitle": "contig1"}
+                            out.write("\t".join(str(row[c]) for c in OUTFMT_COLUMNS) + "\n")
+            return output_path
+
+    FakeTool.__name__ = f"Fake{base_cls.__name__}"
+    return FakeTool()
+
+
+def prepare_references(args) -> List[str]:
+    """在 REF_DIR 下写入合成参考库，返回数据库 ID 列表"""
+    rng = random.Random(args.seed)
+    db_ids = []
+    for i in range(args.databases):
+        db_id = f"load_ref{i + 1}.fa"
+        write_fasta(os.path.join(os.environ["REF_DIR"], db_id), random_reference(rng, args.ref_size, 4))
+        db_ids.append(db_id)
+    return db_ids
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextmanager
+def local_service(args):
+    """启动本进程内的 Celery worker 与 uvicorn 服务，产出服务地址"""
+    import uvicorn
+    from celery.contrib.testing.worker import start_worker
+    from tools.blast import BlastTool
+    from tools.minimap2 import Minimap2Tool
+    from resources import SHORT_QUEUE, HEAVY_QUEUE
+    import tasks
+    import main
+
+    tasks.tools["blast"] = fake_tool(BlastTool, args.search_ms / 1000, args.hits_per_query)
+    tasks.tools["minimap2"] = fake_tool(Minimap2Tool, args.search_ms / 1000, args.hits_per_query)
+
+    config = uvicorn.Config(main.app, host="127.0.0.1", port=_free_port(), log_level="warning")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    with start_worker(tasks.celery_app, pool="threads", concurrency=args.worker_concurrency,
+                      perform_ping_check=False, queues=[SHORT_QUEUE, HEAVY_QUEUE]):
+        thread.start()
+        while not server.started:
+            if not thread.is_alive():
+                raise RuntimeError("uvicorn failed to start")
+            time.sleep(0.05)
+        try:
+            yield f"http://127.0.0.1:{config.port}"
+        finally:
+            server.should_exit = True
+            thread.join(timeout=10)
+
+
+def sample_queues(args, recorder: Recorder, stop: threading.Event, started: float) -> None:
+    """定期采样 broker 中各队列等待的消息数，以及已提交、已结束的任务数"""
+    from tasks import celery_app
+    from resources import SHORT_QUEUE, HEAVY_QUEUE
+
+    with celery_app.connection_for_read() as conn:
+        channel = conn.default_channel
+        while not stop.is_set():
+            depth = {}
+            for queue in (SHORT_QUEUE, HEAVY_QUEUE):
+                try:
+                    depth[queue] = channel.queue_declare(queue=queue, passive=True).message_count
+                except Exception:
+                    depth[queue] = 0
+            recorder.sample({
+                "t": round(time.perf_counter() - started, 2),
+                "queued": depth,
+                "submitted": recorder.submitted,
+                "finished": len(recorder.jobs),
+            })
+            stop.wait(args.sample_interval)
+
+
+def run_user(user: int, args, base_url: str, db_ids: List[str], recorder: Recorder, deadline: float) -> None:
+    """单个用户循环: 上传或粘贴查询 -> 提交任务 -> 轮询状态直到结束 -> 读取第一页命中"""
+    import httpx
+
+    rng = random.Random(args.seed * 1000 + user)
+    reference = [("contig1", "".join(rng.choices(BASES, k=args.query_length * 4)))]
+
+    def call(client: httpx.Client, endpoint: str, method: str, url: str, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            recorder.request(endpoint, time.perf_counter() - started, False, type(e).__name__)
+            return None
+        ok = response.status_code < 400
+        recorder.request(endpoint, time.perf_counter() - started, ok, None if ok else str(response.status_code))
+        return response if ok else None
+
+    with httpx.Client(base_url=base_url, timeout=args.request_timeout) as client:
+        n = 0
+        while time.perf_counter() < deadline and (not args.jobs_per_user or n < args.jobs_per_user):
+            n += 1
+            queries = sample_queries(rng, reference, args.queries, args.query_length, 0.01)
+            text = "".join(f">u{user}_{n}_{name}\n{seq}\n" for name, seq in queries)
+            body = {"tool": args.tool, "db_ids": db_ids, "options": {}}
+            if rng.random() < args.upload_ratio:
+                response = call(client, "POST /api/databases/upload", "POST", "/api/databases/upload",
+                                files={"file": (f"user{user}.fa", text.encode())})
+                if response is None:
+                    continue
+                body["query_filename"] = response.json()["filename"]
+            else:
+                body["query_sequence"] = text
+
+            submitted = time.perf_counter()
+            response = call(client, SUBMIT, "POST", "/api/jobs/", json=body)
+            if response is None:
+                continue
+            job_id = response.json()["job_id"]
+            state = "PENDING"
+            polls = 0
+            while time.perf_counter() - submitted < args.job_timeout:
+                time.sleep(args.poll_interval)
+                polls += 1
+                response = call(client, "GET /api/jobs/{job_id}", "GET", f"/api/jobs/{job_id}")
+                if response is not None:
+                    state = response.json()["state"]
+                    if state in TERMINAL_STATES:
+                        break
+            else:
+                state = "TIMEOUT"
+            recorder.job({"user": user, "state": state, "seconds": time.perf_counter() - submitted, "polls": polls})
+            if state == "SUCCESS":
+                call(client, "GET /api/jobs/{job_id}/hits", "GET", f"/api/jobs/{job_id}/hits",
+                     params={"limit": 100})
+            if args.think_ms:
+                time.sleep(args.think_ms / 1000)
+
+
+def run_load(args, base_url: str, db_ids: List[str]) -> Dict[str, Any]:
+    recorder = Recorder()
+    stop = threading.Event()
+    started = time.perf_counter()
+    deadline = started + args.duration
+    sampler = None
+    if args.broker or not args.url:
+        sampler = threading.Thread(target=sample_queues, args=(args, recorder, stop, started), daemon=True)
+        sampler.start()
+
+    users = [threading.Thread(target=run_user, args=(i + 1, args, base_url, db_ids, recorder, deadline), daemon=True)
+             for i in range(args.users)]
+    for i, user in enumerate(users):
+        user.start()
+        # 用户在 ramp-up 时间内均匀启动
+        if args.ramp_up and i < len(users) - 1:
+            time.sleep(args.ramp_up / len(users))
+    for user in users:
+        user.join()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    if sampler is not None:
+        sampler.join()
+    return summarize(recorder, elapsed)
+
+
+def summarize(recorder: Recorder, elapsed: float) -> Dict[str, Any]:
+    endpoints = {}
+    for endpoint, calls in sorted(recorder.requests.items()):
+        endpoints[endpoint] = {
+            "requests": len(calls),
+            "errors": sum(1 for _, ok in calls if not ok),
+            "requests_per_sec": round(len(calls) / elapsed, 2),
+            **latency_summary([seconds for seconds, _ in calls]),
+        }
+    states = defaultdict(int)
+    for job in recorder.jobs:
+        states[job["state"]] += 1
+    completed = [job["seconds"] for job in recorder.jobs if job["state"] == "SUCCESS"]
+    total_requests = sum(e["requests"] for e in endpoints.values())
+    return {
+        "summary": {
+            "seconds": round(elapsed, 2),
+            "requests": total_requests,
+            "requests_per_sec": round(total_requests / elapsed, 2),
+            "errors": sum(e["errors"] for e in endpoints.values()),
+            "jobs": dict(states),
+            "jobs_per_sec": round(len(completed) / elapsed, 3),
+            "max_queued": max((sum(s["queued"].values()) for s in recorder.samples), default=None),
+        },
+        "endpoints": endpoints,
+        # 提交到客户端观察到任务结束的时间，包含轮询间隔带来的误差
+        "job_latency": latency_summary(completed),
+        "errors": dict(recorder.errors),
+        "queue_depth": recorder.samples,
+    }
+
+
+def _report(result: Dict[str, Any]) -> None:
+    summary = result["summary"]
+    print(f"{summary['seconds']}s  {summary['requests_per_sec']} req/s  {summary['jobs_per_sec']} jobs/s  "
+          f"jobs={summary['jobs']}  errors={summary['errors']}  max_queued={summary['max_queued']}", file=sys.stderr)
+    for endpoint, e in result["endpoints"].items():
+        print(f"  {endpoint:<30} n={e['requests']:<7} err={e['errors']:<5} p50={e['p50_ms']:>9.2f}ms "
+              f"p99={e['p99_ms']:>9.2f}ms max={e['max_ms']:>9.2f}ms", file=sys.stderr)
+    job = result["job_latency"]
+    if job["p50_ms"] is not None:
+        print(f"  {'job (submit -> done)':<30} p50={job['p50_ms']:>9.2f}ms p99={job['p99_ms']:>9.2f}ms",
+              file=sys.stderr)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="HTTP 接口与任务队列压力测试，结果以 JSON 输出")
+    parser.add_argument("--users", type=int, default=10, help="并发用户数")
+    parser.add_argument("--duration", type=float, default=30, help="压测时长 (秒)，到时后不再提交新任务")
+    parser.add_argument("--jobs-per-user", type=int, default=0, help="每个用户最多提交的任务数，0 表示不限")
+    parser.add_argument("--ramp-up", type=float, default=0, help="所有用户启动完成所用的时间 (秒)")
+    parser.add_argument("--tool", default="minimap2", choices=["blast", "minimap2"])
+    parser.add_argument("--databases", type=int, default=1, help="合成参考库数量，每个任务比对全部参考库")
+    parser.add_argument("--ref-size", type=int, default=100_000, help="每个合成参考库的长度 (bp)")
+    parser.add_argument("--queries", type=int, default=1, help="每个任务的查询序列条数")
+    parser.add_argument("--query-length", type=int, default=500, help="查询序列长度 (bp)")
+    parser.add_argument("--upload-ratio", type=float, default=0.2, help="先上传文件再提交的任务比例，其余粘贴序列")
+    parser.add_argument("--poll-interval", type=float, default=0.5, help="轮询任务状态的间隔 (秒)")
+    parser.add_argument("--think-ms", type=float, default=0, help="用户两次任务之间的等待时间 (毫秒)")
+    parser.add_argument("--job-timeout", type=float, default=120, help="单个任务的最长等待时间 (秒)")
+    parser.add_argument("--request-timeout", type=float, default=30, help="单个 HTTP 请求的超时时间 (秒)")
+    parser.add_argument("--search-ms", type=float, default=200, help="假工具每次比对的耗时 (毫秒)")
+    parser.add_argument("--hits-per-query", type=int, default=5, help="假工具为每条查询生成的命中数")
+    parser.add_argument("--worker-concurrency", type=int, default=4, help="本地 worker 的线程数")
+    parser.add_argument("--broker", help="Celery broker 地址，默认使用内存 broker；可指向本地 Redis")
+    parser.add_argument("--url", help="压测已部署的服务，不启动本地服务与 worker")
+    parser.add_argument("--db-ids", nargs="+", help="--url 模式下比对的数据库 ID")
+    parser.add_argument("--sample-interval", type=float, default=0.5, help="队列深度采样间隔 (秒)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--work-dir", help="工作目录，默认使用临时目录并在结束后删除")
+    parser.add_argument("--output", help="结果 JSON 路径，默认输出到标准输出")
+    args = parser.parse_args(argv)
+    if args.users < 1:
+        parser.error("--users must be >= 1")
+    if args.url and not args.db_ids:
+        parser.error("--url requires --db-ids")
+    return args
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    try:
+        import httpx  # noqa: F401
+    except ImportError as e:
+        raise SystemExit(f"loadtest requires httpx: {e}")
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="align-load-")
+    broker = args.broker or "memory://"
+    if not args.url:
+        for name in _WORK_ENV:
+            path = os.path.join(work_dir, name.split("_")[0].lower())
+            os.makedirs(path, exist_ok=True)
+            os.environ[name] = path
+        # 每个任务都经过 (假) 比对，不命中结果缓存
+        os.environ["RESULT_CACHE_MAX_MB"] = "0"
+        os.environ["CELERY_RESULT_BACKEND"] = broker if broker.startswith(("redis://", "rediss://")) \
+            else "cache+memory://"
+    os.environ["CELERY_BROKER_URL"] = broker
+
+    try:
+        # 工具与服务的调试输出写到标准错误，标准输出只留给 JSON 结果
+        with redirect_stdout(sys.stderr), ExitStack() as stack:
+            if args.url:
+                base_url, db_ids = args.url.rstrip("/"), args.db_ids
+            else:
+                db_ids = prepare_references(args)
+                base_url = stack.enter_context(local_service(args))
+            result = run_load(args, base_url, db_ids)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    _report(result)
+
+    report = {
+        "commit": _git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "params": {k: v for k, v in vars(args).items() if k not in ("output", "work_dir")},
+        **result,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
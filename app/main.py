@@ -1,6 +1,6 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from routers import databases, jobs, tools
+from routers import databases, jobs, tools, cache, metrics, storage
 import os
 
 app = FastAPI(
@@ -20,13 +20,16 @@ app.add_middleware(
 
 # Ensure data directories exist
 DATA_DIR = "/data"
-for d in ["references", "results", "uploads"]:
+for d in ["references", "results", "uploads", "cache"]:
     os.makedirs(os.path.join(DATA_DIR, d), exist_ok=True)
 
 # Include routers
 app.include_router(databases.router)
 app.include_router(jobs.router)
 app.include_router(tools.router)
+app.include_router(cache.router)
+app.include_router(metrics.router)
+app.include_router(storage.router)
 
 @app.get("/")
 def root():
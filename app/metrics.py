@@ -0,0 +1,195 @@
+"""
+任务指标模块
+
+worker 在每个任务结束时把清单中的分阶段耗时与子进程资源占用累加到共享的指标文件
+(跨进程 flock 加锁读写)，API 进程的 /metrics 接口将其渲染为 Prometheus 文本格式:
+- align_jobs_total{tool,status}                       任务数
+- align_job_hits_total{tool}                          命中数
+- align_job_duration_seconds{tool}                    任务总耗时直方图
+- align_queue_wait_seconds{tool}                      排队等待直方图
+- align_stage_duration_seconds{tool,stage}            search / parse / merge / serialize 各阶段直方图
+- align_database_search_seconds{tool,database}        单个数据库比对耗时直方图
+- align_search_cpu_seconds_total{tool,database}       比对子进程 CPU 时间
+- align_search_peak_rss_bytes{tool,database}          最近一次比对子进程的内存峰值
+"""
+import fcntl
+import json
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+import job_storage
+
+METRICS_PATH = os.getenv("METRICS_PATH", os.path.join(job_storage.RESULTS_DIR, "metrics.json"))
+
+# 直方图桶上界 (秒)
+DURATION_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+STAGES = ("search", "parse", "merge", "serialize")
+
+_HELP = {
+    "align_jobs_total": ("counter", "Alignment jobs by final status"),
+    "align_job_hits_total": ("counter", "Hits written by completed jobs"),
+    "align_job_duration_seconds": ("histogram", "Job run time from start of search to manifest"),
+    "align_queue_wait_seconds": ("histogram", "Time between submission and the worker starting the job"),
+    "align_stage_duration_seconds": ("histogram", "Job time per pipeline stage"),
+    "align_database_search_seconds": ("histogram", "Search time per database, summed over query chunks"),
+    "align_search_cpu_seconds_total": ("counter", "CPU time of search subprocesses"),
+    "align_search_peak_rss_bytes": ("gauge", "Peak RSS of the most recent search subprocess"),
+}
+
+
+class StageTimer:
+    """累计任务各阶段耗时 (秒)"""
+
+    def __init__(self):
+        self.seconds: Dict[str, float] = defaultdict(float)
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - started
+
+    def iterate(self, name: str, iterable: Iterable) -> Iterator:
+        """只计入取下一个元素所用的时间，消费方处理元素的时间不计入"""
+        it = iter(iterable)
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                self.seconds[name] += time.perf_counter() - started
+                return
+            self.seconds[name] += time.perf_counter() - started
+            yield item
+
+    def rounded(self) -> Dict[str, float]:
+        return {f"{name}_seconds": round(value, 3) for name, value in self.seconds.items()}
+
+
+def queue_wait(request) -> Optional[float]:
+    """任务请求头中的提交时间到现在的秒数，没有提交时间时返回 None"""
+    submitted = getattr(request, "submitted_at", None)
+    if submitted is None and isinstance(getattr(request, "headers", None), dict):
+        submitted = request.headers.get("submitted_at")
+    return max(0.0, time.time() - submitted) if submitted else None
+
+
+@contextmanager
+def _locked_metrics():
+    """跨进程加锁读写指标文件"""
+    os.makedirs(os.path.dirname(METRICS_PATH) or ".", exist_ok=True)
+    with open(METRICS_PATH, "a+") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            f.seek(0)
+            content = f.read()
+            data = json.loads(content) if content else {}
+            yield data
+            f.seek(0)
+            f.truncate()
+            json.dump(data, f)
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _key(labels: Dict[str, str]) -> str:
+    return json.dumps(sorted(labels.items()))
+
+
+def _inc(data: dict, name: str, labels: Dict[str, str], value: float = 1) -> None:
+    series = data.setdefault(name, {})
+    key = _key(labels)
+    series[key] = series.get(key, 0) + value
+
+
+def _set(data: dict, name: str, labels: Dict[str, str], value: float) -> None:
+    data.setdefault(name, {})[_key(labels)] = value
+
+
+def _observe(data: dict, name: str, labels: Dict[str, str], value: float) -> None:
+    series = data.setdefault(name, {})
+    hist = series.setdefault(_key(labels), {"buckets": [0] * len(DURATION_BUCKETS), "sum": 0.0, "count": 0})
+    for i, bound in enumerate(DURATION_BUCKETS):
+        if value <= bound:
+            hist["buckets"][i] += 1
+    hist["sum"] += value
+    hist["count"] += 1
+
+
+def observe_job(tool: str, manifest: Dict[str, Any]) -> None:
+    """累加一个已完成任务清单中的耗时与资源占用"""
+    timings = manifest.get("timings") or {}
+    with _locked_metrics() as data:
+        _inc(data, "align_jobs_total", {"tool": tool, "status": "success"})
+        _inc(data, "align_job_hits_total", {"tool": tool}, manifest.get("hits_count", 0))
+        _observe(data, "align_job_duration_seconds", {"tool": tool}, timings.get("total_seconds", 0.0))
+        if timings.get("queue_wait_seconds") is not None:
+            _observe(data, "align_queue_wait_seconds", {"tool": tool}, timings["queue_wait_seconds"])
+        for stage in STAGES:
+            if f"{stage}_seconds" in timings:
+                _observe(data, "align_stage_duration_seconds", {"tool": tool, "stage": stage},
+                         timings[f"{stage}_seconds"])
+        for database, usage in (timings.get("databases") or {}).items():
+            labels = {"tool": tool, "database": database}
+            _observe(data, "align_database_search_seconds", labels, usage["search_seconds"])
+            _inc(data, "align_search_cpu_seconds_total", labels, usage["cpu_seconds"])
+            if usage["max_rss_mb"]:
+                _set(data, "align_search_peak_rss_bytes", labels, int(usage["max_rss_mb"] * 1024 * 1024))
+
+
+def observe_failure(tool: str) -> None:
+    with _locked_metrics() as data:
+        _inc(data, "align_jobs_total", {"tool": tool, "status": "failure"})
+
+
+def _load() -> dict:
+    try:
+        with open(METRICS_PATH) as f:
+            fcntl.flock(f, fcntl.LOCK_SH)
+            try:
+                return json.load(f)
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+    except (OSError, ValueError):
+        return {}
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(pairs, extra: Optional[tuple] = None) -> str:
+    pairs = list(pairs) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render() -> str:
+    """Prometheus 文本格式 (0.0.4)"""
+    data = _load()
+    lines = []
+    for name, (kind, help_text) in _HELP.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for key, value in sorted((data.get(name) or {}).items()):
+            pairs = json.loads(key)
+            if kind != "histogram":
+                lines.append(f"{name}{_labels(pairs)} {_number(value)}")
+                continue
+            for bound, count in zip(DURATION_BUCKETS, value["buckets"]):
+                lines.append(f"{name}_bucket{_labels(pairs, ('le', bound))} {count}")
+            lines.append(f"{name}_bucket{_labels(pairs, ('le', '+Inf'))} {value['count']}")
+            lines.append(f"{name}_sum{_labels(pairs)} {_number(value['sum'])}")
+            lines.append(f"{name}_count{_labels(pairs)} {value['count']}")
+    return "\n".join(lines) + "\n"
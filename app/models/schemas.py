@@ -16,6 +16,12 @@ class DatabaseInfo(BaseModel):
     genome_version: Optional[str] = None   # 基因组版本
     sequence_type: Optional[str] = None    # cds/protein/genome/transcript
     description: Optional[str] = None      # 描述信息
+    # 序列统计 (建立 .fai 索引后可用)
+    sequence_count: Optional[int] = None   # 序列条数
+    total_length: Optional[int] = None     # 总长度 (bp)
+    max_length: Optional[int] = None       # 最长序列长度
+    n50: Optional[int] = None
+    gc_percent: Optional[float] = None
 
 class DatabaseUpdate(BaseModel):
     """用于更新数据库元数据"""
@@ -25,7 +31,32 @@ class DatabaseUpdate(BaseModel):
     description: Optional[str] = None
 
 class IndexRequest(BaseModel):
-    tool: str  # 'blast' or 'minimap2'
+    """索引请求，tool 与 tools 至少给出一项；presets 为额外构建的 minimap2 预设索引"""
+    tool: Optional[str] = None  # 'blast', 'minimap2' or 'faidx'
+    tools: Optional[List[str]] = None
+    presets: Optional[List[str]] = None  # 'map-ont', 'asm5', 'sr' ...
+    force: bool = False  # 忽略索引清单，强制重建
+
+class RegionRequest(BaseModel):
+    """参考序列区间，1-based 闭区间"""
+    seqid: str
+    start: int
+    end: int
+    strand: str = "+"
+
+class RegionBatch(BaseModel):
+    regions: List[RegionRequest]
+    flank: int = 0  # 两侧各延伸的碱基数
+
+class Region(BaseModel):
+    seqid: str
+    start: Optional[int] = None
+    end: Optional[int] = None
+    strand: str = "+"
+    flank_left: int = 0
+    flank_right: int = 0
+    sequence: Optional[str] = None
+    error: Optional[str] = None  # 批量提取时单个区间的错误信息
 
 class JobSubmit(BaseModel):
     query_filename: Optional[str] = None
@@ -39,3 +70,22 @@ class JobStatus(BaseModel):
     state: str
     status: Optional[str] = None
     result: Optional[Any] = None
+    progress: Optional[Any] = None  # PROGRESS 状态下的进度快照
+
+class AlignResult(BaseModel):
+    """快速通道结果: direct 为同步比对的前 top_k 个命中，queued 时按 job_id 查询排队任务"""
+    mode: str  # 'direct' or 'queued'
+    job_id: Optional[str] = None
+    state: Optional[str] = None
+    tool: Optional[str] = None
+    total: Optional[int] = None
+    hits: Optional[List[dict]] = None
+    seconds: Optional[float] = None
+
+class HitPage(BaseModel):
+    """分页命中结果"""
+    tool: str
+    total: int
+    offset: int
+    limit: int
+    hits: List[dict]
@@ -0,0 +1,87 @@
+"""
+任务进度推送模块
+
+任务执行过程中的每个事件 (数据库开始/完成、查询分块完成、累计命中数、当前最优命中) 会:
+1. 通过 update_state 以 PROGRESS 状态保存当前进度快照，供状态接口读取;
+2. 发布到 Redis 频道 job-progress:<job_id>，供 SSE 接口实时推送给前端。
+"""
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+from redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# 进度事件中携带的当前最优命中数
+PROGRESS_TOP_HITS = int(os.getenv("PROGRESS_TOP_HITS", "10"))
+
+# 终止事件，SSE 接口收到后结束推送
+TERMINAL_EVENTS = {"completed", "failed"}
+
+
+def progress_channel(job_id: str) -> str:
+    return f"job-progress:{job_id}"
+
+
+def publish_event(job_id: str, event: Dict[str, Any]) -> None:
+    """发布进度事件，Redis 不可用时只记录日志"""
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        client.publish(progress_channel(job_id), json.dumps(event, default=str))
+    except Exception as e:
+        logger.warning(f"Failed to publish progress for {job_id}: {e}")
+
+
+class ProgressReporter:
+    """维护任务进度快照并推送事件，可在比对线程池中并发调用"""
+
+    def __init__(self, task, job_id: str, tool: str, databases: List[str], chunks: Optional[int] = None):
+        self.task = task
+        self.job_id = job_id
+        self.snapshot: Dict[str, Any] = {
+            "tool": tool,
+            "databases": {db: "pending" for db in databases},
+            "hits_so_far": 0,
+            "top_hits": [],
+        }
+        if chunks is not None:
+            # 查询拆分后的比对单元 (数据库 × 查询分块) 完成数
+            self.snapshot["chunks"] = {"total": chunks, "finished": 0}
+        self._lock = threading.Lock()
+
+    def emit(self, event: str, database: Optional[str] = None, **data: Any) -> None:
+        with self._lock:
+            if database is not None:
+                self.snapshot["databases"][database] = {
+                    "database_started": "running",
+                    "database_finished": "finished",
+                }.get(event, self.snapshot["databases"].get(database))
+            if event == "chunk_finished" and "chunks" in self.snapshot:
+                self.snapshot["chunks"]["finished"] += 1
+            for key in ("hits_so_far", "top_hits"):
+                if key in data:
+                    self.snapshot[key] = data[key]
+
+            if event not in TERMINAL_EVENTS and self.task is not None:
+                # 显式传入 task_id：比对线程中没有 Celery 的线程局部请求上下文
+                self.task.update_state(task_id=self.job_id, state="PROGRESS", meta=self.snapshot)
+            payload = {"event": event, "job_id": self.job_id, **data}
+            if database is not None:
+                payload["database"] = database
+            publish_event(self.job_id, payload)
+
+
+class ReporterGroup:
+    """把同一事件转发给批处理中的每个任务"""
+
+    def __init__(self, reporters: List[ProgressReporter]):
+        self.reporters = reporters
+
+    def emit(self, event: str, database: Optional[str] = None, **data: Any) -> None:
+        for reporter in self.reporters:
+            reporter.emit(event, database=database, **data)
@@ -0,0 +1,118 @@
+"""
+查询文件上传模块
+
+上传内容按块写入磁盘，边写边校验 FASTA 格式并统计序列条数与长度，
+gzip / bgzip (多成员 gzip) 压缩文件在写入时即时解压。
+超过大小上限或格式错误时立即中止并删除已写入的部分，
+统计信息保存在查询文件旁，供提交任务时选择队列和拆分查询直接使用。
+"""
+import os
+import re
+import uuid
+import zlib
+from typing import Any, Dict
+
+from fasta import FastaValidator, write_stats
+
+# 单个查询 (解压后) 的大小上限 (MB)
+MAX_QUERY_MB = int(os.getenv("MAX_QUERY_MB", "512"))
+# 每次从上传流读取的字节数
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+class QueryTooLargeError(ValueError):
+    """查询超过大小上限"""
+
+
+def safe_filename(filename: str) -> str:
+    """去除路径和压缩后缀，只保留安全字符，并加上随机前缀避免覆盖其他上传"""
+    name = os.path.basename((filename or "").replace("\\", "/"))
+    for suffix in (".gz", ".bgz"):
+        if name.lower().endswith(suffix):
+            name = name[: -len(suffix)]
+    name = re.sub(r"[^A-Za-z0-9._-]", "_", name).lstrip(".") or "query.fasta"
+    return f"upload_{uuid.uuid4().hex[:8]}_{name}"
+
+
+class QueryWriter:
+    """增量写入查询文件：识别压缩格式、解压、校验并限制大小
+
+    用法:
+        with QueryWriter(path) as writer:
+            writer.write(chunk)
+        stats = writer.stats
+    """
+
+    def __init__(self, path: str, max_bytes: int = MAX_QUERY_MB * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.validator = FastaValidator()
+        self.written = 0
+        self.compressed = None  # 收到第一个数据块后确定
+        self.stats: Dict[str, Any] = {}
+        self._decompressor = None
+        self._head = b""
+        self._tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+
+    def __enter__(self) -> "QueryWriter":
+        self._file = open(self._tmp_path, "wb")
+        return self
+
+    def write(self, data: bytes) -> None:
+        if self.compressed is None:
+            # 凑够魔数长度后再判断是否为 gzip
+            self._head += data
+            if len(self._head) < len(GZIP_MAGIC):
+                return
+            data, self._head = self._head, b""
+            self.compressed = data.startswith(GZIP_MAGIC)
+        if self.compressed:
+            self._decompress(data)
+        else:
+            self._emit(data)
+
+    def _decompress(self, data: bytes) -> None:
+        # 每次最多解压 UPLOAD_CHUNK_SIZE 字节，高压缩比的输入也能及时触发大小上限
+        while data:
+            if self._decompressor is None:
+                self._decompressor = zlib.decompressobj(wbits=31)
+            try:
+                self._emit(self._decompressor.decompress(data, UPLOAD_CHUNK_SIZE))
+            except zlib.error as e:
+                raise ValueError(f"Invalid gzip data: {e}")
+            if self._decompressor.eof:
+                # bgzip 由多个 gzip 成员拼接而成，剩余数据属于下一个成员
+                data = self._decompressor.unused_data
+                self._decompressor = None
+            else:
+                data = self._decompressor.unconsumed_tail
+
+    def _emit(self, data: bytes) -> None:
+        self.written += len(data)
+        if self.written > self.max_bytes:
+            raise QueryTooLargeError(f"Query exceeds the {self.max_bytes // (1024 * 1024)} MB limit")
+        self.validator.feed(data)
+        self._file.write(data)
+
+    def close(self) -> Dict[str, Any]:
+        if self.compressed is None and self._head:
+            self.compressed = False
+            self._emit(self._head)
+        if self._decompressor is not None and not self._decompressor.eof:
+            raise ValueError("Truncated gzip data")
+        self.stats = {**self.validator.close(), "bytes": self.written, "compressed": bool(self.compressed)}
+        return self.stats
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        try:
+            if exc_type is None:
+                self.close()
+                self._file.close()
+                os.replace(self._tmp_path, self.path)
+                write_stats(self.path, self.stats)
+        finally:
+            self._file.close()
+            if os.path.exists(self._tmp_path):
+                os.remove(self._tmp_path)
@@ -0,0 +1,36 @@
+"""
+Redis 客户端模块
+
+复用 Celery broker 的 Redis 连接地址，供进度推送等需要直接访问 Redis 的功能使用。
+broker 不是 Redis 时 (如本地调试使用内存 broker) 返回 None，调用方需自行降级。
+"""
+import os
+from typing import Optional
+
+import redis
+import redis.asyncio as aioredis
+
+CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0")
+
+_client: Optional[redis.Redis] = None
+
+
+def is_redis_broker() -> bool:
+    return CELERY_BROKER_URL.startswith(("redis://", "rediss://", "unix://"))
+
+
+def get_redis() -> Optional[redis.Redis]:
+    """进程内共享的同步客户端 (连接池线程安全)"""
+    global _client
+    if not is_redis_broker():
+        return None
+    if _client is None:
+        _client = redis.Redis.from_url(CELERY_BROKER_URL)
+    return _client
+
+
+def get_async_redis() -> Optional[aioredis.Redis]:
+    """异步客户端，供 FastAPI 流式接口使用，调用方负责关闭"""
+    if not is_redis_broker():
+        return None
+    return aioredis.Redis.from_url(CELERY_BROKER_URL)
@@ -0,0 +1,106 @@
+"""
+参考序列区间提取模块
+
+优先通过 .fai 索引计算字节偏移，从内存映射的参考 FASTA 中直接切片读取，
+耗时与基因组大小无关；没有 .fai 的纯 BLAST 库退回到 blastdbcmd -range。
+接口坐标均为 1-based 闭区间 (与 BLAST sstart/send 一致)。
+"""
+import os
+import subprocess
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from faidx import FAI_SUFFIX, FastaReader, is_fresh
+from tools.blast import BlastTool
+
+# 单个区间 (含两侧延伸) 的最大长度
+MAX_REGION_LENGTH = int(os.getenv("MAX_REGION_LENGTH", "1000000"))
+# 批量接口单次最多提取的区间数
+MAX_BATCH_REGIONS = int(os.getenv("MAX_BATCH_REGIONS", "1000"))
+# 保持打开的参考序列数
+READER_CACHE_SIZE = 32
+
+_COMPLEMENT = str.maketrans("ACGTURYKMSWBDHVNacgturykmswbdhvn", "TGCAAYRMKSWVHDBNtgcaayrmkswvhdbn")
+
+_blast = BlastTool()
+_readers: "OrderedDict[str, tuple]" = OrderedDict()
+_readers_lock = threading.Lock()
+
+
+class RegionIndexMissing(LookupError):
+    """参考序列既没有可用的 .fai 索引也不是 BLAST 库"""
+
+
+def reverse_complement(seq: str) -> str:
+    return seq.translate(_COMPLEMENT)[::-1]
+
+
+def get_reader(fasta_path: str) -> Optional[FastaReader]:
+    """返回缓存的 FastaReader，.fai 不存在或早于 FASTA 时返回 None"""
+    if not is_fresh(fasta_path):
+        return None
+    stamp = (os.path.getmtime(fasta_path), os.path.getmtime(fasta_path + FAI_SUFFIX))
+    with _readers_lock:
+        cached = _readers.get(fasta_path)
+        if cached is not None and cached[0] == stamp:
+            _readers.move_to_end(fasta_path)
+            return cached[1]
+        reader = FastaReader(fasta_path)
+        # 旧的 reader 可能仍在其他线程中使用，交由垃圾回收关闭
+        _readers[fasta_path] = (stamp, reader)
+        _readers.move_to_end(fasta_path)
+        while len(_readers) > READER_CACHE_SIZE:
+            _readers.popitem(last=False)
+        return reader
+
+
+def is_blast_db(db_path: str) -> bool:
+    return any(os.path.exists(db_path + s) for s in (".nin", ".nal"))
+
+
+def fetch_region(db_path: str, seqid: str, start: int, end: int, strand: str = "+",
+                 flank: int = 0) -> Dict[str, Any]:
+    """提取 [start, end] 区间及两侧各 flank bp，负链返回反向互补序列
+
+    坐标非法时抛出 ValueError，序列名不存在时抛出 KeyError。
+    """
+    if start < 1 or end < start:
+        raise ValueError(f"Invalid region {start}-{end}")
+    if strand not in ("+", "-"):
+        raise ValueError(f"Invalid strand: {strand}")
+    flank = max(0, flank)
+    if end - start + 1 + 2 * flank > MAX_REGION_LENGTH:
+        raise ValueError(f"Region exceeds {MAX_REGION_LENGTH} bp")
+
+    region_start = max(1, start - flank)
+    region_end = end + flank
+    reader = get_reader(db_path) if os.path.exists(db_path) else None
+    if reader is not None:
+        if seqid not in reader.entries:
+            raise KeyError(f"Sequence {seqid} not found")
+        region_end = min(region_end, reader.entries[seqid].length)
+        sequence = reader.fetch(seqid, region_start - 1, region_end)
+        if strand == "-":
+            sequence = reverse_complement(sequence)
+    elif is_blast_db(db_path):
+        try:
+            sequence = _blast.fetch_region(db_path, seqid, region_start, region_end,
+                                           "minus" if strand == "-" else "plus")
+        except subprocess.CalledProcessError as e:
+            raise KeyError(f"Sequence {seqid} not found: {(e.stderr or '').strip()}")
+        region_end = region_start + len(sequence) - 1
+    else:
+        raise RegionIndexMissing("Reference has no .fai index; build it with the 'faidx' index tool")
+
+    if region_start > region_end:
+        raise ValueError(f"Region {start}-{end} is outside sequence {seqid}")
+    return {
+        "seqid": seqid,
+        "start": region_start,
+        "end": region_end,
+        "strand": strand,
+        "flank_left": start - region_start,
+        "flank_right": max(0, region_end - end),
+        "sequence": sequence,
+    }
@@ -0,0 +1,136 @@
+"""
+比对资源调度模块
+
+每次比对按线程数占用 CPU、按索引大小估算内存，
+worker 进程内的所有比对共享同一份 CPU/内存预算，预算不足时排队等待。
+未显式设置预算时，worker 启动时按执行任务的进程数均分整机 CPU 与内存 (见 configure_worker)，
+prefork 池的多个子进程合计不会超出整机资源。
+提交任务时按参考库与查询规模选择队列，基因组级的大任务与短序列任务分开执行。
+"""
+import os
+import threading
+from contextlib import contextmanager
+from typing import Iterable, Optional
+
+from fasta import load_stats
+from tools.minimap2 import Minimap2Tool
+
+# 单个 worker 进程内并行比对可占用的 CPU 核数，未设置时为整机核数除以 worker 进程数
+SEARCH_CPU_BUDGET = int(os.getenv("SEARCH_CPU_BUDGET", str(os.cpu_count() or 1)))
+# 单个 worker 进程内并行比对可占用的内存 (MB)，未设置时为物理内存的一半除以 worker 进程数
+SEARCH_MEMORY_BUDGET_MB = int(os.getenv(
+    "SEARCH_MEMORY_BUDGET_MB",
+    str(os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // (2 * 1024 * 1024)),
+))
+# 单次比对可请求的线程数上限
+MAX_THREADS_PER_SEARCH = int(os.getenv("MAX_THREADS_PER_SEARCH", "8"))
+
+# 队列划分
+SHORT_QUEUE = os.getenv("CELERY_SHORT_QUEUE", "celery")
+HEAVY_QUEUE = os.getenv("CELERY_HEAVY_QUEUE", "heavy")
+# 快速通道 (进程内 mappy 比对) 队列，应由 threads 池的 worker 处理以共享常驻索引
+FAST_QUEUE = os.getenv("CELERY_FAST_QUEUE", "fast")
+# 参考库总大小或查询文件大小超过阈值的任务进入 heavy 队列
+HEAVY_REFERENCE_MB = int(os.getenv("HEAVY_REFERENCE_MB", "500"))
+HEAVY_QUERY_MB = int(os.getenv("HEAVY_QUERY_MB", "10"))
+
+# 每次比对除索引外的固定内存开销估计
+SEARCH_BASE_MEMORY = 64 * 1024 * 1024
+# 没有可用 .mmi 时 minimap2 现场建索引，内存约为序列长度的倍数
+MM2_ONTHEFLY_INDEX_FACTOR = 4
+
+MB = 1024 * 1024
+
+_minimap2 = Minimap2Tool()
+
+
+def search_threads(options: dict) -> int:
+    """用户请求的线程数，限制在 [1, MAX_THREADS_PER_SEARCH]"""
+    return max(1, min(int(options.get("threads", 1)), MAX_THREADS_PER_SEARCH, resource_pool.cpus))
+
+
+def _size(path: str) -> int:
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def estimate_memory(tool_name: str, db_path: str, options: Optional[dict] = None) -> int:
+    """按比对实际载入的索引大小估算单次比对的内存占用 (字节)"""
+    if tool_name == "minimap2":
+        # minimap2 将整个索引载入内存，与比对时一样按预设解析出实际使用的索引
+        target = _minimap2.resolve_index(db_path, options or {})
+        if target == db_path:
+            index_size = sequence_size(db_path) * MM2_ONTHEFLY_INDEX_FACTOR
+        else:
+            index_size = _size(target)
+    else:
+        # BLAST 以内存映射方式读取序列与描述文件
+        index_size = (_size(db_path + ".nsq") + _size(db_path + ".nhr")) or _size(db_path)
+    return index_size + SEARCH_BASE_MEMORY
+
+
+def sequence_size(path: str) -> int:
+    """序列总长度，优先使用上传或建索引时记录的统计信息，否则按文件大小估计"""
+    stats = load_stats(path)
+    return stats["residues"] if stats else _size(path)
+
+
+def reference_size(db_paths: Iterable[str]) -> int:
+    return sum(sequence_size(p) for p in db_paths)
+
+
+def choose_queue(query_path: str, db_paths: Iterable[str]) -> str:
+    """基因组级参考库或大查询进入 heavy 队列，其余进入短任务队列"""
+    if reference_size(db_paths) > HEAVY_REFERENCE_MB * MB or sequence_size(query_path) > HEAVY_QUERY_MB * MB:
+        return HEAVY_QUEUE
+    return SHORT_QUEUE
+
+
+class ResourcePool:
+    """进程内 CPU/内存预算，比对在获得足够资源后才开始
+
+    超过总预算的请求按总预算计，即独占整个 worker 运行，而不是永远等待。
+    """
+
+    def __init__(self, cpus: int, memory_bytes: int):
+        self.cpus = cpus
+        self.memory_bytes = memory_bytes
+        self._free_cpus = cpus
+        self._free_memory = memory_bytes
+        self._cond = threading.Condition()
+
+    def resize(self, cpus: int, memory_bytes: int) -> None:
+        """调整总预算，已预留的资源在释放时按新预算归还"""
+        with self._cond:
+            self._free_cpus += cpus - self.cpus
+            self._free_memory += memory_bytes - self.memory_bytes
+            self.cpus = cpus
+            self.memory_bytes = memory_bytes
+            self._cond.notify_all()
+
+    @contextmanager
+    def reserve(self, cpus: int, memory_bytes: int):
+        cpus = min(cpus, self.cpus)
+        memory_bytes = min(memory_bytes, self.memory_bytes)
+        with self._cond:
+            self._cond.wait_for(lambda: self._free_cpus >= cpus and self._free_memory >= memory_bytes)
+            self._free_cpus -= cpus
+            self._free_memory -= memory_bytes
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._free_cpus += cpus
+                self._free_memory += memory_bytes
+                self._cond.notify_all()
+
+
+resource_pool = ResourcePool(SEARCH_CPU_BUDGET, SEARCH_MEMORY_BUDGET_MB * MB)
+
+
+def configure_worker(processes: int) -> None:
+    """worker 启动时调用: 未设置 SEARCH_CPU_BUDGET / SEARCH_MEMORY_BUDGET_MB 时按执行任务的进程数均分默认预算"""
+    processes = max(1, processes)
+    cpus = SEARCH_CPU_BUDGET if "SEARCH_CPU_BUDGET" in os.environ else max(1, SEARCH_CPU_BUDGET // processes)
+    memory_mb = SEARCH_MEMORY_BUDGET_MB if "SEARCH_MEMORY_BUDGET_MB" in os.environ \
+        else max(1, SEARCH_MEMORY_BUDGET_MB // processes)
+    resource_pool.resize(cpus, memory_mb * MB)
@@ -0,0 +1,237 @@
+"""
+比对结果缓存模块
+
+以 (规范化查询序列, 参考库文件标识, 工具, 规范化参数) 的哈希作为键，
+缓存单个数据库的原始比对结果文件。相同查询重复提交时直接复用结果，跳过比对。
+缓存按 TTL 过期，并在超出容量时按最近使用时间淘汰。
+"""
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable
+
+# Default to Docker path, with local fallback
+CACHE_DIR = os.getenv("RESULT_CACHE_DIR", "/data/cache")
+if not os.path.exists(CACHE_DIR):
+    CACHE_DIR = "data/cache"
+
+RESULT_CACHE_MAX_MB = int(os.getenv("RESULT_CACHE_MAX_MB", "1024"))
+RESULT_CACHE_TTL_HOURS = float(os.getenv("RESULT_CACHE_TTL_HOURS", "168"))
+# 两次淘汰扫描之间的最小间隔 (秒)
+RESULT_CACHE_EVICT_INTERVAL = int(os.getenv("RESULT_CACHE_EVICT_INTERVAL", "60"))
+
+# 不影响比对结果的参数，不参与缓存键计算
+# 解析结果时才应用的命中过滤条件，不影响比对输出
+HIT_FILTER_OPTIONS = {"min_mapq", "primary_only"}
+NON_RESULT_OPTIONS = {"threads", "top_k", "sort_by"} | HIT_FILTER_OPTIONS
+
+
+def query_digest(query_path: str) -> str:
+    """规范化查询 FASTA 后计算哈希：忽略空白与换行位置，序列统一大写"""
+    h = hashlib.sha256()
+    with open(query_path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith(">"):
+                h.update(b"\n" + line.encode() + b"\n")
+            else:
+                h.update("".join(line.split()).upper().encode())
+    return h.hexdigest()
+
+
+def file_identity(paths: Iterable[str]) -> list:
+    """参考库文件标识：存在的文件的 (文件名, 大小, 修改时间)"""
+    identity = []
+    for path in paths:
+        if os.path.exists(path):
+            st = os.stat(path)
+            identity.append([os.path.basename(path), st.st_size, st.st_mtime_ns])
+    return identity
+
+
+def cache_key(query_hash: str, db_files: Iterable[str], tool_name: str, result_suffix: str,
+              options: Dict[str, Any]) -> str:
+    canonical = {
+        "query": query_hash,
+        "reference": file_identity(db_files),
+        "tool": tool_name,
+        "format": result_suffix,
+        "options": {k: v for k, v in (options or {}).items() if k not in NON_RESULT_OPTIONS},
+    }
+    payload = json.dumps(canonical, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, cache_dir: str, max_bytes: int, ttl_seconds: float):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @property
+    def stats_path(self) -> str:
+        return os.path.join(self.cache_dir, "stats.json")
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    @contextmanager
+    def _locked_stats(self):
+        """跨进程加锁读写统计信息"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(self.stats_path, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                content = f.read()
+                stats = json.loads(content) if content else {}
+                yield stats
+                f.seek(0)
+                f.truncate()
+                json.dump(stats, f)
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _count(self, field: str) -> None:
+        with self._locked_stats() as stats:
+            stats[field] = stats.get(field, 0) + 1
+
+    def fetch(self, key: str, dest_path: str) -> bool:
+        """命中时将缓存结果放到 dest_path 并返回 True"""
+        if not self.enabled:
+            return False
+        path = self._entry_path(key)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            self._count("misses")
+            return False
+        if time.time() - st.st_mtime > self.ttl_seconds:
+            self._remove(path)
+            self._count("misses")
+            return False
+
+        _link_or_copy(path, dest_path)
+        # 更新修改时间作为最近使用时间
+        os.utime(path)
+        self._count("hits")
+        return True
+
+    def store(self, key: str, src_path: str) -> None:
+        if not self.enabled:
+            return
+        path = self._entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        _link_or_copy(src_path, tmp_path)
+        os.replace(tmp_path, path)
+        os.utime(path)
+
+        with self._locked_stats() as stats:
+            now = time.time()
+            due = now - stats.get("last_evict", 0) >= RESULT_CACHE_EVICT_INTERVAL
+            if due:
+                stats["last_evict"] = now
+        if due:
+            self.evict()
+
+    def _entries(self):
+        for sub in os.listdir(self.cache_dir):
+            sub_dir = os.path.join(self.cache_dir, sub)
+            if not os.path.isdir(sub_dir):
+                continue
+            for name in os.listdir(sub_dir):
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(sub_dir, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, st.st_size, st.st_mtime
+
+    def _remove(self, path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def evict(self) -> int:
+        """删除过期条目，并按最近使用时间淘汰直到总大小不超过上限，返回删除的条目数"""
+        if not os.path.isdir(self.cache_dir):
+            return 0
+        now = time.time()
+        removed = 0
+        live = []
+        for path, size, mtime in self._entries():
+            if now - mtime > self.ttl_seconds:
+                self._remove(path)
+                removed += 1
+            else:
+                live.append((mtime, size, path))
+
+        total = sum(size for _, size, _ in live)
+        live.sort()
+        for _, size, path in live:
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+            removed += 1
+
+        if removed:
+            with self._locked_stats() as stats:
+                stats["evictions"] = stats.get("evictions", 0) + removed
+        return removed
+
+    def clear(self) -> None:
+        if not os.path.isdir(self.cache_dir):
+            return
+        for path, _, _ in list(self._entries()):
+            self._remove(path)
+
+    def stats(self) -> Dict[str, Any]:
+        entries = list(self._entries()) if os.path.isdir(self.cache_dir) else []
+        counters = {}
+        if os.path.exists(self.stats_path):
+            with self._locked_stats() as stats:
+                counters = dict(stats)
+        hits = counters.get("hits", 0)
+        misses = counters.get("misses", 0)
+        return {
+            "enabled": self.enabled,
+            "entries": len(entries),
+            "size_bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            "evictions": counters.get("evictions", 0),
+        }
+
+
+def _link_or_copy(src: str, dest: str) -> None:
+    """同一文件系统上使用硬链接，否则复制"""
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copyfile(src, dest)
+
+
+result_cache = ResultCache(
+    CACHE_DIR,
+    RESULT_CACHE_MAX_MB * 1024 * 1024,
+    RESULT_CACHE_TTL_HOURS * 3600,
+)
@@ -0,0 +1,206 @@
+"""
+存储保留模块
+
+查询上传目录、任务结果目录与结果缓存通常位于同一个数据卷。定期清理任务 (Celery beat) 按以下顺序释放空间:
+1. 删除超过 JOB_RETENTION_HOURS 未使用的任务目录、超过 UPLOAD_RETENTION_HOURS 未使用的上传文件、
+   已完成任务的粘贴查询 (只用于一次比对) 以及中断上传残留的临时文件
+2. 结果缓存按自身的有效期与容量淘汰
+3. 总占用仍超过 STORAGE_MAX_MB 时，按最近使用时间淘汰已完成的任务目录与上传文件
+
+最近 RETENTION_GRACE_MINUTES 内创建或使用过的文件不会因容量淘汰，尚未完成的任务的查询文件不会被删除。
+删除任务目录时同时删除 Celery 中的任务结果，状态接口不会指向已删除的文件。
+与结果缓存硬链接共享的文件在缓存条目淘汰前不会真正释放空间，占用统计按 inode 去重。
+"""
+import json
+import os
+import shutil
+import time
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+import job_storage
+from fasta import STATS_SUFFIX
+from result_cache import result_cache
+
+# Default to Docker path, with local fallback
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "/data/uploads")
+if not os.path.exists(UPLOAD_DIR):
+    UPLOAD_DIR = "data/uploads"
+
+# 上传文件保留时长 (小时)，提交任务时使用上传文件会刷新其最近使用时间
+UPLOAD_RETENTION_HOURS = float(os.getenv("UPLOAD_RETENTION_HOURS", str(job_storage.JOB_RETENTION_HOURS)))
+# 上传、结果与缓存目录的总容量上限 (MB)，为 0 时只按保留时长清理
+STORAGE_MAX_MB = int(os.getenv("STORAGE_MAX_MB", "0"))
+# 最近创建或使用的文件在该时长内不因容量淘汰 (分钟)
+RETENTION_GRACE_MINUTES = float(os.getenv("RETENTION_GRACE_MINUTES", "60"))
+
+# 粘贴序列保存的查询文件前缀，每个文件只属于一个任务
+PASTE_PREFIX = "paste_"
+# 最近一次清理的报告
+REPORT_PATH = os.path.join(job_storage.RESULTS_DIR, "retention.json")
+
+MB = 1024 * 1024
+
+
+def _walk(root: str) -> Iterator[Tuple[str, os.stat_result]]:
+    """递归产出目录下的 (文件路径, lstat)"""
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            try:
+                yield path, os.lstat(path)
+            except FileNotFoundError:
+                continue
+
+
+def _freed_bytes(stats) -> int:
+    """删除后实际释放的字节数，仍有其他硬链接 (如结果缓存条目) 的文件不计入"""
+    return sum(st.st_size for st in stats if st.st_nlink <= 1)
+
+
+def _job_units() -> Dict[str, Dict[str, Any]]:
+    """任务 ID -> 任务目录信息，有清单的任务已完成"""
+    units = {}
+    if not os.path.isdir(job_storage.RESULTS_DIR):
+        return units
+    for entry in os.scandir(job_storage.RESULTS_DIR):
+        if not entry.is_dir(follow_symlinks=False):
+            continue
+        try:
+            last_used = entry.stat(follow_symlinks=False).st_mtime
+        except FileNotFoundError:
+            continue
+        units[entry.name] = {
+            "paths": [entry.path],
+            "last_used": last_used,
+            "completed": os.path.exists(os.path.join(entry.path, job_storage.MANIFEST_FILENAME)),
+            "query": job_storage.load_query(entry.name),
+            "freed": _freed_bytes(st for _, st in _walk(entry.path)),
+        }
+    return units
+
+
+def _upload_units() -> Dict[str, Dict[str, Any]]:
+    """文件名 -> 上传文件信息，查询文件与其统计信息文件作为一个单元"""
+    units = {}
+    if not os.path.isdir(UPLOAD_DIR):
+        return units
+    for entry in os.scandir(UPLOAD_DIR):
+        if not entry.is_file(follow_symlinks=False):
+            continue
+        try:
+            st = entry.stat(follow_symlinks=False)
+        except FileNotFoundError:
+            continue
+        name = entry.name[: -len(STATS_SUFFIX)] if entry.name.endswith(STATS_SUFFIX) else entry.name
+        unit = units.setdefault(name, {"paths": [], "last_used": 0.0, "freed": 0})
+        unit["paths"].append(entry.path)
+        unit["last_used"] = max(unit["last_used"], st.st_mtime)
+        unit["freed"] += _freed_bytes([st])
+    return units
+
+
+def _remove(unit: Dict[str, Any]) -> None:
+    for path in unit["paths"]:
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def collect(forget: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    """按保留时长与容量上限清理上传文件、任务目录和结果缓存，返回清理报告
+
+    forget 在删除任务目录时以任务 ID 调用，用于删除 Celery 中的任务结果。
+    """
+    now = time.time()
+    grace = RETENTION_GRACE_MINUTES * 60
+    report = {"expired_jobs": 0, "expired_uploads": 0, "evicted_jobs": 0, "evicted_uploads": 0,
+              "cache_evicted": 0, "freed_bytes": 0}
+    jobs = _job_units()
+    uploads = _upload_units()
+    # 尚未完成的任务仍可能读取查询文件
+    in_use = {os.path.basename(job["query"]) for job in jobs.values() if job["query"] and not job["completed"]}
+    finished_pastes = {os.path.basename(job["query"]) for job in jobs.values()
+                       if job["query"] and job["completed"] and os.path.basename(job["query"]).startswith(PASTE_PREFIX)}
+
+    def remove_job(job_id: str, reason: str) -> None:
+        unit = jobs.pop(job_id)
+        _remove(unit)
+        if forget is not None:
+            forget(job_id)
+        report[f"{reason}_jobs"] += 1
+        report["freed_bytes"] += unit["freed"]
+
+    def remove_upload(name: str, reason: str) -> None:
+        unit = uploads.pop(name)
+        _remove(unit)
+        report[f"{reason}_uploads"] += 1
+        report["freed_bytes"] += unit["freed"]
+
+    for job_id, unit in list(jobs.items()):
+        if now - unit["last_used"] > job_storage.JOB_RETENTION_HOURS * 3600:
+            remove_job(job_id, "expired")
+    for name, unit in list(uploads.items()):
+        if name in in_use:
+            continue
+        age = now - unit["last_used"]
+        if name in finished_pastes or age > UPLOAD_RETENTION_HOURS * 3600 or (name.endswith(".tmp") and age > grace):
+            remove_upload(name, "expired")
+
+    if result_cache.enabled:
+        report["cache_evicted"] = result_cache.evict()
+
+    if STORAGE_MAX_MB > 0:
+        total = usage()["total_bytes"]
+        candidates = [(unit["last_used"], "job", job_id) for job_id, unit in jobs.items() if unit["completed"]]
+        candidates += [(unit["last_used"], "upload", name) for name, unit in uploads.items() if name not in in_use]
+        for last_used, kind, key in sorted(candidates):
+            if total <= STORAGE_MAX_MB * MB or now - last_used <= grace:
+                break
+            total -= (jobs if kind == "job" else uploads)[key]["freed"]
+            if kind == "job":
+                remove_job(key, "evicted")
+            else:
+                remove_upload(key, "evicted")
+
+    report["finished_at"] = now
+    report["seconds"] = round(time.time() - now, 3)
+    os.makedirs(os.path.dirname(REPORT_PATH), exist_ok=True)
+    with job_storage.atomic_output(REPORT_PATH) as tmp_path:
+        with open(tmp_path, "w") as f:
+            json.dump(report, f)
+    return report
+
+
+def last_report() -> Optional[Dict[str, Any]]:
+    try:
+        with open(REPORT_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def usage() -> Dict[str, Any]:
+    """各目录的文件数与占用字节数，硬链接共享的文件只计入先统计的目录"""
+    seen = set()
+    areas = {}
+    for area, root in (("uploads", UPLOAD_DIR), ("results", job_storage.RESULTS_DIR),
+                       ("cache", result_cache.cache_dir)):
+        files = size = 0
+        for _, st in _walk(root):
+            files += 1
+            if (st.st_dev, st.st_ino) not in seen:
+                seen.add((st.st_dev, st.st_ino))
+                size += st.st_size
+        areas[area] = {"files": files, "bytes": size}
+    return {
+        "areas": areas,
+        "total_bytes": sum(area["bytes"] for area in areas.values()),
+        "max_bytes": STORAGE_MAX_MB * MB,
+        "job_retention_hours": job_storage.JOB_RETENTION_HOURS,
+        "upload_retention_hours": UPLOAD_RETENTION_HOURS,
+        "last_collection": last_report(),
+    }
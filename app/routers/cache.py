@@ -0,0 +1,13 @@
+from fastapi import APIRouter
+from result_cache import result_cache
+
+router = APIRouter(prefix="/api/cache", tags=["cache"])
+
+@router.get("/stats")
+def get_cache_stats():
+    return result_cache.stats()
+
+@router.delete("/")
+def clear_cache():
+    result_cache.clear()
+    return {"status": "cleared"}
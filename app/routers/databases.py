@@ -1,9 +1,14 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from models.schemas import DatabaseInfo, IndexRequest
-from database_config import get_db_metadata
-from tasks import index_database
+from fastapi import APIRouter, UploadFile, File, HTTPException, Request, Response
+from models.schemas import DatabaseInfo, IndexRequest, Region, RegionBatch
+from catalog import DatabaseCatalog
+from tasks import build_indexes, celery_app
+from indexing import parse_target, IndexTargetError
+from redis_client import get_redis
+from regions import fetch_region, RegionIndexMissing, MAX_BATCH_REGIONS
+from query_upload import QueryWriter, QueryTooLargeError, safe_filename, UPLOAD_CHUNK_SIZE
+from starlette.concurrency import run_in_threadpool
 import os
-import shutil
+import uuid
 from typing import List
 
 router = APIRouter(prefix="/api/databases", tags=["databases"])
@@ -17,58 +22,119 @@ UPLOAD_DIR = os.getenv("UPLOAD_DIR", "/data/uploads")
 if not os.path.exists(UPLOAD_DIR):
     UPLOAD_DIR = "data/uploads"
 
+catalog = DatabaseCatalog(REF_DIR)
+
 @router.get("/", response_model=List[DatabaseInfo])
-def list_databases():
-    dbs = []
-    if not os.path.exists(REF_DIR):
-        return []
-        
-    for f in os.listdir(REF_DIR):
-        if f.endswith((".fa", ".fasta")):
-            # Check for indices
-            has_blast = os.path.exists(os.path.join(REF_DIR, f + ".nin"))
-            has_mm2 = os.path.exists(os.path.join(REF_DIR, f + ".mmi"))
-            
-            tools = []
-            if has_blast: tools.append("blast")
-            if has_mm2: tools.append("minimap2")
-            
-            # 获取元数据
-            metadata = get_db_metadata(f)
-            
-            dbs.append(DatabaseInfo(
-                id=f,
-                name=f,
-                path=os.path.join(REF_DIR, f),
-                indexed=len(tools) > 0,
-                tools=tools,
-                species=metadata.get("species"),
-                genome_version=metadata.get("genome_version"),
-                sequence_type=metadata.get("sequence_type"),
-                description=metadata.get("description"),
-            ))
+def list_databases(request: Request, response: Response):
+    """数据库列表，支持 If-None-Match 条件请求，未变化时返回 304"""
+    etag, dbs = catalog.list()
+    if etag:
+        candidates = [t.strip().removeprefix("W/") for t in request.headers.get("if-none-match", "").split(",")]
+        if etag in candidates or "*" in candidates:
+            return Response(status_code=304, headers={"ETag": etag})
+        response.headers["ETag"] = etag
+        # 浏览器每次都向服务端确认，目录未变化时只传输 304
+        response.headers["Cache-Control"] = "no-cache"
     return dbs
 
+# 相同参考序列、相同目标的索引请求在该时间 (秒) 内复用进行中的任务
+INDEX_DEDUP_SECONDS = 6 * 3600
+
 @router.post("/{db_id}/index")
 def create_index(db_id: str, request: IndexRequest):
+    """构建一个或多个索引，已是最新的目标跳过；进度通过 /api/jobs/{job_id} 查询"""
+    if os.path.basename(db_id) != db_id:
+        raise HTTPException(status_code=400, detail="Invalid database id")
     db_path = os.path.join(REF_DIR, db_id)
     if not os.path.exists(db_path):
         raise HTTPException(status_code=404, detail="Database not found")
-    
-    output_path = db_path
-    if request.tool == "minimap2":
-        output_path = db_path + ".mmi"
-    
-    task = index_database.delay(db_path, request.tool, output_path)
-    return {"job_id": task.id, "state": "PENDING"}
+
+    targets = list(request.tools or [])
+    if request.tool:
+        targets.append(request.tool)
+    targets.extend(f"minimap2:{preset}" for preset in request.presets or [])
+    # 比对索引总是连同 .fai 与统计信息一起维护
+    if targets and "faidx" not in targets:
+        targets.append("faidx")
+    targets = sorted(set(targets))
+    if not targets:
+        raise HTTPException(status_code=400, detail="No index tool given")
+    try:
+        for target in targets:
+            parse_target(target)
+    except IndexTargetError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # 同一组目标已有未完成的任务时直接返回该任务；SET NX 保证并发请求只有一个提交
+    job_id = str(uuid.uuid4())
+    client = get_redis()
+    if client is not None:
+        dedup_key = f"index-job:{db_id}:{','.join(targets)}"
+        if not client.set(dedup_key, job_id, nx=True, ex=INDEX_DEDUP_SECONDS):
+            existing = (client.get(dedup_key) or b"").decode()
+            if existing and not request.force and not celery_app.AsyncResult(existing).ready():
+                return {"job_id": existing, "state": "PENDING", "targets": targets, "deduplicated": True}
+            client.set(dedup_key, job_id, ex=INDEX_DEDUP_SECONDS)
+
+    build_indexes.apply_async((db_path, targets, request.force), task_id=job_id)
+    return {"job_id": job_id, "state": "PENDING", "targets": targets}
+
+def _reference_path(db_id: str) -> str:
+    """数据库路径，FASTA 与 BLAST 库都不存在时返回 404"""
+    if os.path.basename(db_id) != db_id:
+        raise HTTPException(status_code=400, detail="Invalid database id")
+    db_path = os.path.join(REF_DIR, db_id)
+    if not os.path.exists(db_path) and not any(os.path.exists(db_path + s) for s in (".nin", ".nal")):
+        raise HTTPException(status_code=404, detail="Database not found")
+    return db_path
+
+@router.get("/{db_id}/region", response_model=Region)
+def get_region(db_id: str, seqid: str, start: int, end: int, strand: str = "+", flank: int = 0):
+    """提取参考序列区间 (1-based 闭区间) 及两侧 flank bp"""
+    db_path = _reference_path(db_id)
+    try:
+        return fetch_region(db_path, seqid, start, end, strand, flank)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+    except RegionIndexMissing as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/{db_id}/regions", response_model=List[Region])
+def get_regions(db_id: str, batch: RegionBatch):
+    """批量提取区间，单个区间的错误写入该区间的 error 字段"""
+    db_path = _reference_path(db_id)
+    if len(batch.regions) > MAX_BATCH_REGIONS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_REGIONS} regions per request")
+    results = []
+    for region in batch.regions:
+        try:
+            results.append(fetch_region(db_path, region.seqid, region.start, region.end, region.strand, batch.flank))
+        except RegionIndexMissing as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        except (KeyError, ValueError) as e:
+            results.append({"seqid": region.seqid, "strand": region.strand, "error": str(e.args[0])})
+    return results
 
 @router.post("/upload")
 async def upload_for_alignment(file: UploadFile = File(...)):
+    """分块写入查询文件，即时解压 gzip 并校验 FASTA，返回保存的文件名和序列统计"""
     if not os.path.exists(UPLOAD_DIR):
         os.makedirs(UPLOAD_DIR)
-        
-    file_path = os.path.join(UPLOAD_DIR, file.filename)
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    return {"filename": file.filename, "size": os.path.getsize(file_path)}
+
+    filename = safe_filename(file.filename)
+    file_path = os.path.join(UPLOAD_DIR, filename)
+    try:
+        with QueryWriter(file_path) as writer:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                await run_in_threadpool(writer.write, chunk)
+    except QueryTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"filename": filename, "size": os.path.getsize(file_path), **writer.stats}
 
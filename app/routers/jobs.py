@@ -1,7 +1,40 @@
 from fastapi import APIRouter, HTTPException, BackgroundTasks
-from models.schemas import JobSubmit, JobStatus
-from tasks import celery_app, run_blast, run_minimap2
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from models.schemas import JobSubmit, JobStatus, HitPage, AlignResult
+from tasks import celery_app, run_blast, run_minimap2, run_batch, align_fast
+from hit_merge import TOOL_SORT_KEYS, MAX_TOP_K
+from hit_store import query_hits
+from progress import progress_channel, TERMINAL_EVENTS
+from redis_client import get_async_redis
+from resources import choose_queue, SHORT_QUEUE, FAST_QUEUE
+from query_upload import QueryWriter, QueryTooLargeError
+from celery.exceptions import TimeoutError as CeleryTimeoutError
+import batching
+import fasta
+import job_storage
+import retention
+import asyncio
+import json
+import logging
 import os
+import time
+import uuid
+from typing import Optional
+
+# SSE 心跳间隔 (秒)
+EVENT_KEEPALIVE_SECONDS = 15
+# broker 不是 Redis 时服务端检查任务状态的间隔 (秒)
+EVENT_POLL_SECONDS = 1
+# 任务结束的状态，SSE 推送到这些状态后关闭连接
+TERMINAL_JOB_STATES = ("SUCCESS", "FAILURE", "REVOKED")
+
+# 快速通道 (POST /api/jobs/align) 同步比对的查询总长度上限 (bp)，为 0 时禁用
+FAST_PATH_MAX_RESIDUES = int(os.getenv("FAST_PATH_MAX_RESIDUES", "0"))
+# 等待快速通道 worker 返回结果的最长时间 (秒)，超时后转为排队任务
+FAST_PATH_TIMEOUT = float(os.getenv("FAST_PATH_TIMEOUT", "5"))
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/jobs", tags=["jobs"])
 
@@ -13,50 +46,245 @@ REF_DIR = os.getenv("REF_DIR", "/data/references")
 if not os.path.exists(REF_DIR):
     REF_DIR = "data/references"
 
+def validate_job(job: JobSubmit) -> list:
+    """校验任务参数，返回数据库路径列表"""
+    if job.tool not in ("blast", "minimap2"):
+        raise HTTPException(status_code=400, detail="Unsupported tool")
+    sort_by = (job.options or {}).get("sort_by")
+    if sort_by and sort_by not in TOOL_SORT_KEYS[job.tool]:
+        raise HTTPException(status_code=400, detail=f"Unsupported sort_by for {job.tool}: {sort_by}")
+    min_mapq = (job.options or {}).get("min_mapq")
+    if min_mapq is not None and (not isinstance(min_mapq, int) or isinstance(min_mapq, bool)
+                                 or not 0 <= min_mapq <= 255):
+        raise HTTPException(status_code=400, detail="min_mapq must be an integer between 0 and 255")
+    # threads 与 top_k 在 worker 中直接转换为整数，null 同样拒绝
+    threads = (job.options or {}).get("threads", 1)
+    if not isinstance(threads, int) or isinstance(threads, bool) or threads < 1:
+        raise HTTPException(status_code=400, detail="threads must be a positive integer")
+    top_k = (job.options or {}).get("top_k", 1)
+    if not isinstance(top_k, int) or isinstance(top_k, bool) or not 1 <= top_k <= MAX_TOP_K:
+        raise HTTPException(status_code=400, detail=f"top_k must be an integer between 1 and {MAX_TOP_K}")
+
+    # 验证并获取所有数据库路径
+    db_paths = []
+    for db_id in job.db_ids:
+        db_path = os.path.join(REF_DIR, db_id)
+        if not os.path.exists(db_path):
+            raise HTTPException(status_code=404, detail=f"Database {db_id} not found")
+        db_paths.append(db_path)
+    return db_paths
+
 @router.post("/", response_model=JobStatus)
 def submit_job(job: JobSubmit):
     if job.query_sequence:
         # Save sequence to a temporary file
-        import uuid
-        filename = f"paste_{uuid.uuid4().hex[:8]}.fasta"
+        filename = f"{retention.PASTE_PREFIX}{uuid.uuid4().hex[:8]}.fasta"
         query_path = os.path.join(UPLOAD_DIR, filename)
-        with open(query_path, "w") as f:
-            f.write(job.query_sequence)
+        try:
+            with QueryWriter(query_path) as writer:
+                writer.write(job.query_sequence.encode())
+        except QueryTooLargeError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid query sequence: {e}")
     elif job.query_filename:
+        if os.path.basename(job.query_filename) != job.query_filename:
+            raise HTTPException(status_code=400, detail="Invalid query filename")
         query_path = os.path.join(UPLOAD_DIR, job.query_filename)
         if not os.path.exists(query_path):
             raise HTTPException(status_code=404, detail="Query file not found")
+        # 刷新上传文件的最近使用时间，保留策略按此淘汰
+        os.utime(query_path)
     else:
         raise HTTPException(status_code=400, detail="Either query_filename or query_sequence must be provided")
     
-    # 验证并获取所有数据库路径
-    db_paths = []
-    for db_id in job.db_ids:
-        db_path = os.path.join(REF_DIR, db_id)
-        if not os.path.exists(db_path):
-            raise HTTPException(status_code=404, detail=f"Database {db_id} not found")
-        db_paths.append(db_path)
-    
+    db_paths = validate_job(job)
+
+    # 按参考库与查询规模分配到短任务或大任务队列
+    queue = choose_queue(query_path, db_paths)
+    options = job.options or {}
+    if job.query_sequence and queue == SHORT_QUEUE and batching.batching_enabled() \
+            and batching.is_batchable(query_path):
+        # 粘贴的短序列放入批次队列，与相同数据库和参数的任务合并比对
+        job_id = str(uuid.uuid4())
+        key = batching.batch_key(job.tool, db_paths, options)
+        size = batching.enqueue(key, {"job_id": job_id, "query_path": query_path, "options": options,
+                                      "submitted_at": time.time()})
+        if size % batching.BATCH_MAX_JOBS == 0:
+            # 批次已满，立即比对
+            run_batch.apply_async((job.tool, db_paths, key, queue), queue=queue)
+        elif batching.claim_flush(key):
+            run_batch.apply_async((job.tool, db_paths, key, queue), countdown=batching.BATCH_WINDOW_MS / 1000,
+                                  queue=queue)
+        return JobStatus(job_id=job_id, state="PENDING")
+
+    # 提交时间随消息头传给 worker，用于统计排队等待时间
+    headers = {"submitted_at": time.time()}
     if job.tool == "blast":
-        task = run_blast.delay(query_path, db_paths, job.options)
-    elif job.tool == "minimap2":
-        task = run_minimap2.delay(query_path, db_paths, job.options)
+        task = run_blast.apply_async((query_path, db_paths, job.options), queue=queue, headers=headers)
     else:
-        raise HTTPException(status_code=400, detail="Unsupported tool")
+        task = run_minimap2.apply_async((query_path, db_paths, job.options), queue=queue, headers=headers)
     
     return JobStatus(job_id=task.id, state="PENDING")
 
+def fast_path_records(job: JobSubmit) -> Optional[list]:
+    """可走快速通道时返回解析后的 [(序列名, 序列)]，否则返回 None"""
+    if FAST_PATH_MAX_RESIDUES <= 0 or job.tool != "minimap2" or not job.query_sequence:
+        return None
+    validator = fasta.FastaValidator()
+    try:
+        validator.feed(job.query_sequence.encode())
+        stats = validator.close()
+    except fasta.FastaFormatError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid query sequence: {e}")
+    if stats["residues"] > FAST_PATH_MAX_RESIDUES:
+        return None
+    return fasta.parse_records(job.query_sequence)
+
+@router.post("/align", response_model=AlignResult)
+def align_sequence(job: JobSubmit):
+    """同步比对短序列: 粘贴的 minimap2 查询总长度不超过 FAST_PATH_MAX_RESIDUES 时，
+    由快速通道 worker 在进程内用常驻索引比对并直接返回前 top_k 个命中；
+    其他查询、超时或快速通道不可用时按普通任务排队，返回 job_id"""
+    db_paths = validate_job(job)
+    records = fast_path_records(job)
+    if records is not None:
+        # 没有快速通道 worker 消费时消息在超时后作废，不会在之后重复执行
+        task = align_fast.apply_async((records, db_paths, job.options or {}), queue=FAST_QUEUE,
+                                      expires=FAST_PATH_TIMEOUT)
+        try:
+            result = task.get(timeout=FAST_PATH_TIMEOUT)
+            return AlignResult(mode="direct", **result)
+        except CeleryTimeoutError:
+            logger.warning(f"Fast path timed out after {FAST_PATH_TIMEOUT}s, queueing job")
+            task.revoke()
+        except Exception as e:
+            logger.warning(f"Fast path failed, queueing job: {e}")
+        finally:
+            # 结果已直接返回，不必留在结果后端
+            task.forget()
+
+    status = submit_job(job)
+    return AlignResult(mode="queued", job_id=status.job_id, state=status.state)
+
 @router.get("/{job_id}", response_model=JobStatus)
 def get_job_status(job_id: str):
     task = celery_app.AsyncResult(job_id)
+    state = task.state
     
     result = None
-    if task.state == 'SUCCESS':
+    progress = None
+    if state == 'SUCCESS':
         result = task.result
+    elif state == 'PROGRESS':
+        progress = task.info
+    elif state == 'PENDING':
+        # Celery 结果过期后从任务目录中的清单恢复
+        manifest = job_storage.load_manifest(job_id)
+        if manifest is not None:
+            state, result = 'SUCCESS', manifest
         
     return JobStatus(
         job_id=job_id,
-        state=task.state,
-        status=str(task.info) if task.state == 'FAILURE' else None,
-        result=result
+        state=state,
+        status=str(task.info) if state == 'FAILURE' else None,
+        result=result,
+        progress=progress
+    )
+
+def _sse(data: dict) -> str:
+    return f"data: {json.dumps(data, default=str)}\n\n"
+
+@router.get("/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """以 Server-Sent Events 推送任务状态变化和各数据库进度
+
+    先推送一次当前状态快照，之后转发任务发布到 Redis 频道的进度事件，
+    直到任务完成或失败。broker 不是 Redis 时退化为服务端定期检查状态。
+    """
+    async def event_stream():
+        redis = get_async_redis()
+        pubsub = None
+        try:
+            if redis is not None:
+                # 先订阅再读取快照，避免遗漏两者之间发布的事件
+                pubsub = redis.pubsub()
+                await pubsub.subscribe(progress_channel(job_id))
+
+            status = await run_in_threadpool(get_job_status, job_id)
+            yield _sse({"event": "snapshot", **status.model_dump()})
+            if status.state in TERMINAL_JOB_STATES:
+                return
+
+            while True:
+                if pubsub is None:
+                    await asyncio.sleep(EVENT_POLL_SECONDS)
+                    current = await run_in_threadpool(get_job_status, job_id)
+                    if current.model_dump() != status.model_dump():
+                        status = current
+                        yield _sse({"event": "snapshot", **status.model_dump()})
+                    if status.state in TERMINAL_JOB_STATES:
+                        return
+                    continue
+
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=EVENT_KEEPALIVE_SECONDS)
+                if message is None:
+                    # worker 崩溃、任务被撤销或结果过期时不会发布结束事件，空闲时检查任务状态
+                    current = await run_in_threadpool(get_job_status, job_id)
+                    if current.state in TERMINAL_JOB_STATES:
+                        yield _sse({"event": "snapshot", **current.model_dump()})
+                        return
+                    yield ": keepalive\n\n"
+                    continue
+                event = json.loads(message["data"])
+                yield _sse(event)
+                if event.get("event") in TERMINAL_EVENTS:
+                    return
+        finally:
+            if pubsub is not None:
+                await pubsub.unsubscribe()
+                await pubsub.aclose()
+            if redis is not None:
+                await redis.aclose()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
+
+@router.get("/{job_id}/hits", response_model=HitPage)
+def get_job_hits(
+    job_id: str,
+    offset: int = 0,
+    limit: int = 100,
+    sort_by: Optional[str] = None,
+    order: Optional[str] = None,
+    database: Optional[str] = None,
+    qseqid: Optional[str] = None,
+    min_pident: Optional[float] = None,
+    max_evalue: Optional[float] = None,
+):
+    """分页读取任务的全部命中，支持排序与过滤"""
+    try:
+        hits_path = job_storage.job_file(job_id, job_storage.HITS_FILENAME)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not os.path.exists(hits_path):
+        raise HTTPException(status_code=404, detail="Results not found")
+    job_storage.touch(job_id)
+
+    try:
+        return query_hits(
+            hits_path,
+            offset=offset,
+            limit=limit,
+            sort_by=sort_by,
+            order=order,
+            database=database,
+            qseqid=qseqid,
+            min_pident=min_pident,
+            max_evalue=max_evalue,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
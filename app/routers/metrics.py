@@ -0,0 +1,10 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+import metrics
+
+router = APIRouter(tags=["metrics"])
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Prometheus 文本格式的任务耗时与资源指标"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
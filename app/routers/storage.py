@@ -0,0 +1,9 @@
+from fastapi import APIRouter
+import retention
+
+router = APIRouter(prefix="/api/storage", tags=["storage"])
+
+@router.get("/usage")
+def get_storage_usage():
+    """上传、结果与缓存目录的占用，以及保留策略和最近一次清理的报告"""
+    return retention.usage()
@@ -1,8 +1,30 @@
 import os
+import time
+import shutil
 import logging
+import threading
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from celery import Celery
+from celery.signals import worker_init, worker_process_init, worker_ready
+from celery.concurrency import get_implementation
+from celery.concurrency.prefork import TaskPool as PreforkPool
+from celery.concurrency.solo import TaskPool as SoloPool
 from tools.blast import BlastTool
 from tools.minimap2 import Minimap2Tool
+from tools.mappy_tool import MappyTool
+from tools.base import collect_usage
+import job_storage
+from result_cache import result_cache, query_digest, cache_key
+from hit_merge import TopK, DEFAULT_SORT_BY, resolve_top_k, hit_identity
+from hit_store import HitStoreWriter, QUERY_FIELD
+from progress import ProgressReporter, ReporterGroup, PROGRESS_TOP_HITS, publish_event
+import batching
+import fasta
+import indexing
+import metrics
+import retention
+from resources import configure_worker, resource_pool, search_threads, estimate_memory
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -11,17 +33,307 @@ logger = logging.getLogger(__name__)
 CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0")
 CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", "redis://localhost:6379/0")
 
+# Celery 结果 (任务清单) 在 Redis 中的保留时长 (小时)
+RESULT_EXPIRES_HOURS = float(os.getenv("RESULT_EXPIRES_HOURS", "24"))
+
 celery_app = Celery(
     "align_tasks",
     broker=CELERY_BROKER_URL,
     backend=CELERY_RESULT_BACKEND
 )
+celery_app.conf.result_expires = int(RESULT_EXPIRES_HOURS * 3600)
+celery_app.conf.beat_schedule = {
+    "cleanup-results": {
+        "task": "tasks.cleanup_results",
+        "schedule": 3600.0,
+    },
+}
 
 # Tool instances
 tools = {
     "blast": BlastTool(),
     "minimap2": Minimap2Tool()
 }
+@worker_init.connect
+def configure_resources(sender=None, **kwargs):
+    """prefork 池的每个子进程各有一份资源池，按子进程数均分默认预算；其他池的任务共享主进程的资源池"""
+    processes = sender.concurrency if issubclass(get_implementation(sender.pool_cls), PreforkPool) else 1
+    configure_worker(processes)
+    logger.info(f"Search budget per worker process: {resource_pool.cpus} CPUs, "
+                f"{resource_pool.memory_bytes // (1024 * 1024)} MB")
+
+# 进程内 minimap2 (mappy)，供快速通道直接比对内存中的短序列
+fast_tool = MappyTool()
+
+# worker 进程启动时预载入常驻索引缓存的参考序列，逗号分隔的 FASTA 路径，可用 `路径:预设` 指定预设索引
+MAPPY_PRELOAD = [item.strip() for item in os.getenv("MAPPY_PRELOAD", "").split(",") if item.strip()]
+
+def preload_indexes():
+    """预载入 MAPPY_PRELOAD 中的索引，快速通道的第一个请求不必等待载入"""
+    for item in MAPPY_PRELOAD:
+        fasta_path, _, preset = item.partition(":")
+        try:
+            if fast_tool.preload(fasta_path, preset or None):
+                logger.info(f"Preloaded minimap2 index: {item}")
+        except Exception as e:
+            logger.warning(f"Cannot preload minimap2 index {item}: {e}")
+
+@worker_process_init.connect
+def preload_process_indexes(**kwargs):
+    """prefork 池的子进程与 solo 池在执行任务的进程启动时预载入"""
+    preload_indexes()
+
+@worker_ready.connect
+def preload_pool_indexes(sender=None, **kwargs):
+    """threads 池在 worker 主进程内执行任务，不会触发 worker_process_init，在 worker 就绪时预载入"""
+    if not isinstance(getattr(sender, "pool", None), (PreforkPool, SoloPool)):
+        preload_indexes()
+
+def search_concurrency(options: dict, n_units: int) -> int:
+    """按每次比对的线程数与本进程的 CPU 预算 (已按 worker 进程数均分) 计算可同时运行的比对数"""
+    return max(1, min(n_units, resource_pool.cpus // search_threads(options)))
+
+def search_databases(job_id: str, tool_name: str, query_paths: list, db_paths: list, options: dict,
+                     reporter: ProgressReporter = None, use_cache: bool = True, usage: dict = None):
+    """并行比对所有 (数据库, 查询分块) 组合，按完成顺序产出 (db_path, chunk, result_path)
+
+    每次比对先从 worker 的资源池中预留 CPU 线程和估算内存，
+    大参考库不会同时载入而超出内存预算。
+    给出 usage 时按数据库名累加比对耗时、子进程 CPU 时间与内存峰值。
+    """
+    tool = tools[tool_name]
+    query_hashes = [query_digest(p) if use_cache and result_cache.enabled else None for p in query_paths]
+    options = {**options, "threads": search_threads(options)}
+    usage_lock = threading.Lock()
+
+    def search_one(db_path, chunk):
+        suffix = tool.result_suffix if len(query_paths) == 1 else f".part{chunk}{tool.result_suffix}"
+        result_path = job_storage.result_path(job_id, db_path, suffix)
+        # 任务重试时复用已完成的结果文件
+        if not os.path.exists(result_path):
+            with resource_pool.reserve(options["threads"], estimate_memory(tool_name, db_path, options)), \
+                    job_storage.atomic_output(result_path) as tmp_path:
+                if reporter:
+                    reporter.emit("database_started", database=os.path.basename(db_path), chunk=chunk)
+                key = None
+                if query_hashes[chunk]:
+                    db_files = [db_path] + [db_path + s for s in tool.index_suffixes]
+                    key = cache_key(query_hashes[chunk], db_files, tool_name, tool.result_suffix, options)
+                started = time.perf_counter()
+                with collect_usage() as child:
+                    if key and result_cache.fetch(key, tmp_path):
+                        logger.info(f"Result cache hit: {os.path.basename(db_path)}")
+                    else:
+                        tool.search(query_paths[chunk], db_path, options, tmp_path)
+                        if key:
+                            result_cache.store(key, tmp_path)
+                if usage is not None:
+                    with usage_lock:
+                        db_usage = usage.setdefault(os.path.basename(db_path), new_usage())
+                        db_usage["search_seconds"] += time.perf_counter() - started
+                        db_usage["cpu_seconds"] += child["cpu_seconds"]
+                        db_usage["max_rss_mb"] = max(db_usage["max_rss_mb"], child["max_rss_mb"])
+        return result_path
+
+    units = [(db_path, chunk) for db_path in db_paths for chunk in range(len(query_paths))]
+    with ThreadPoolExecutor(max_workers=search_concurrency(options, len(units))) as pool:
+        futures = {pool.submit(search_one, *unit): unit for unit in units}
+        for future in as_completed(futures):
+            db_path, chunk = futures[future]
+            yield db_path, chunk, future.result()
+
+def new_usage() -> dict:
+    return {"search_seconds": 0.0, "cpu_seconds": 0.0, "max_rss_mb": 0.0}
+
+def job_timings(timer: metrics.StageTimer, usage: dict, queue_wait: float = None) -> dict:
+    """清单中的分阶段耗时、各数据库比对耗时与子进程资源占用"""
+    databases = {db: {k: round(v, 3) for k, v in u.items()} for db, u in usage.items()}
+    return {
+        "queue_wait_seconds": None if queue_wait is None else round(queue_wait, 3),
+        **timer.rounded(),
+        "databases": databases,
+        "child_cpu_seconds": round(sum(u["cpu_seconds"] for u in usage.values()), 3),
+        "child_max_rss_mb": round(max((u["max_rss_mb"] for u in usage.values()), default=0.0), 1),
+    }
+
+def split_stages(timer: metrics.StageTimer, loop_seconds: float, serialize_seconds: float) -> None:
+    """由读取命中的总耗时 (ingest) 与其中的解析耗时推算 search / merge 阶段"""
+    ingest = timer.seconds.pop("ingest", 0.0)
+    timer.seconds["search"] = max(0.0, loop_seconds - ingest)
+    timer.seconds["merge"] = max(0.0, ingest - timer.seconds["parse"])
+    timer.seconds["serialize"] = serialize_seconds
+
+def iter_database_hits(tool_name: str, db_path: str, result_path: str, options: dict = None):
+    """流式读取单个数据库的命中并添加来源数据库标记，options 中的命中过滤条件在解析时生效"""
+    db_name = os.path.basename(db_path)
+    for hit in tools[tool_name].iter_hits(result_path, options):
+        hit['database'] = db_name
+        yield hit
+
+def build_manifest(tool_name: str, hits_count: int, sort_by: str, db_names: list, hits_path: str,
+                   result_paths: dict, seconds: float, timings: dict = None) -> dict:
+    return {
+        "status": "completed",
+        "tool": tool_name,
+        "hits_count": hits_count,
+        "sort_by": sort_by,
+        "databases": db_names,
+        "files": {
+            "hits": hits_path,
+            "results": result_paths,
+        },
+        "timings": {
+            "total_seconds": round(seconds, 3),
+            **(timings or {}),
+        },
+    }
+
+def run_search(job_id: str, tool_name: str, query_path: str, db_paths: list, options: dict,
+               task=None, queue_wait: float = None) -> dict:
+    """比对所有数据库并将全部命中写入任务的命中存储，返回任务清单
+
+    清单只包含计数、文件位置和耗时，命中本身留在磁盘上，
+    因此 Celery 结果很小，轮询任务状态的开销与命中数无关。
+    大查询文件按序列长度拆分为多个分块，与各数据库组合后并行比对；
+    每个分块完成后立即读取其命中并推送进度，不必等待最慢的比对。
+    清单 timings 记录排队等待、等待比对 (search)、解析 (parse)、写入命中存储与 top-K (merge)、
+    命中存储建索引 (serialize) 的耗时，以及各数据库的比对耗时和子进程资源占用。
+    """
+    db_names = [os.path.basename(p) for p in db_paths]
+    job_path = job_storage.job_dir(job_id)
+    job_storage.record_query(job_id, query_path)
+    query_paths = fasta.split_fasta(query_path, job_path)
+    n_chunks = len(query_paths)
+
+    reporter = ProgressReporter(task, job_id, tool_name, db_names, chunks=len(db_paths) * n_chunks)
+    reporter.emit("started", tool=tool_name, databases=db_names, chunks=reporter.snapshot["chunks"])
+
+    sort_by = options.get("sort_by") or DEFAULT_SORT_BY[tool_name]
+    top = TopK(min(resolve_top_k(options), PROGRESS_TOP_HITS), sort_by)
+    result_paths = {db: [None] * n_chunks for db in db_names}
+    remaining = {db: n_chunks for db in db_names}
+    db_hits = {db: 0 for db in db_names}
+    timer = metrics.StageTimer()
+    usage = {db: new_usage() for db in db_names}
+
+    started = time.perf_counter()
+    hits_path = os.path.join(job_path, job_storage.HITS_FILENAME)
+    with HitStoreWriter(hits_path, tool_name) as store:
+        for db_path, chunk, result_path in search_databases(job_id, tool_name, query_paths, db_paths, options,
+                                                            reporter, usage=usage):
+            db_name = os.path.basename(db_path)
+            result_paths[db_name][chunk] = result_path
+            # 分片序号按 (数据库, 分块) 的提交顺序编号，与完成顺序无关
+            shard = db_names.index(db_name) * n_chunks + chunk
+            before = store.count
+            with timer.stage("ingest"):
+                hits = timer.iterate("parse", iter_database_hits(tool_name, db_path, result_path, options))
+                top.extend(store.record(hits, shard))
+            db_hits[db_name] += store.count - before
+            remaining[db_name] -= 1
+            reporter.emit(
+                "chunk_finished",
+                database=db_name,
+                chunk=chunk,
+                hits=store.count - before,
+                hits_so_far=store.count,
+                top_hits=top.results(),
+            )
+            if remaining[db_name] == 0:
+                reporter.emit("database_finished", database=db_name, hits=db_hits[db_name])
+        searched = time.perf_counter()
+    finished = time.perf_counter()
+    split_stages(timer, searched - started, finished - searched)
+
+    # 分块文件只在比对期间需要
+    for path in query_paths:
+        if path != query_path:
+            os.remove(path)
+
+    manifest = build_manifest(
+        tool_name, store.count, sort_by, db_names, hits_path, result_paths, finished - started,
+        job_timings(timer, usage, queue_wait),
+    )
+    manifest["chunks"] = n_chunks
+    job_storage.write_manifest(job_id, manifest)
+    reporter.emit("completed", result=manifest)
+    metrics.observe_job(tool_name, manifest)
+    return manifest
+
+def run_batched_search(batch_id: str, tool_name: str, db_paths: list, entries: list, task) -> dict:
+    """合并多个任务的查询只比对一次，再按序列名前缀把命中拆分到各任务
+
+    各任务仍拥有自己的命中存储、清单和进度事件，
+    批次的原始比对结果含有其他任务的命中，拆分完成后即删除。
+    返回 任务 ID -> 任务清单。
+    """
+    db_names = [os.path.basename(p) for p in db_paths]
+    query_field = QUERY_FIELD[tool_name]
+    # 比对参数在批次内一致，线程数取第一个任务的设置
+    options = entries[0]["options"]
+    batch_dir = job_storage.job_dir(batch_id)
+    batch_query = os.path.join(batch_dir, "query.fasta")
+    batching.write_batch_query([e["query_path"] for e in entries], batch_query)
+    for entry in entries:
+        job_storage.record_query(entry["job_id"], entry["query_path"])
+
+    reporters = [ProgressReporter(task, e["job_id"], tool_name, db_names) for e in entries]
+    for reporter in reporters:
+        reporter.emit("started", tool=tool_name, databases=db_names, batch_size=len(entries))
+    sort_bys = [e["options"].get("sort_by") or DEFAULT_SORT_BY[tool_name] for e in entries]
+    tops = [TopK(min(resolve_top_k(e["options"]), PROGRESS_TOP_HITS), sort_by)
+            for e, sort_by in zip(entries, sort_bys)]
+    hits_paths = [os.path.join(job_storage.job_dir(e["job_id"]), job_storage.HITS_FILENAME) for e in entries]
+    # 批次内各任务共享比对阶段的耗时与资源占用，排队等待按各自的提交时间计算
+    timer = metrics.StageTimer()
+    usage = {db: new_usage() for db in db_names}
+    now = time.time()
+    queue_waits = [max(0.0, now - e["submitted_at"]) if e.get("submitted_at") else None for e in entries]
+
+    started = time.perf_counter()
+    try:
+        with ExitStack() as stack:
+            stores = [stack.enter_context(HitStoreWriter(path, tool_name)) for path in hits_paths]
+            # 批次查询每次不同，不经过结果缓存
+            for db_path, _, result_path in search_databases(batch_id, tool_name, [batch_query], db_paths, options,
+                                                            ReporterGroup(reporters), use_cache=False,
+                                                            usage=usage):
+                db_name = os.path.basename(db_path)
+                before = [store.count for store in stores]
+                shard = db_names.index(db_name)
+                with timer.stage("ingest"):
+                    for hit in timer.iterate("parse", iter_database_hits(tool_name, db_path, result_path, options)):
+                        index, hit[query_field] = batching.split_query_name(hit[query_field])
+                        if index is None or index >= len(stores):
+                            continue
+                        stores[index].add(hit, shard)
+                        tops[index].push(hit)
+                for reporter, store, top, count in zip(reporters, stores, tops, before):
+                    reporter.emit(
+                        "database_finished",
+                        database=db_name,
+                        hits=store.count - count,
+                        hits_so_far=store.count,
+                        top_hits=top.results(),
+                    )
+            searched = time.perf_counter()
+        finished = time.perf_counter()
+    finally:
+        shutil.rmtree(batch_dir, ignore_errors=True)
+    split_stages(timer, searched - started, finished - searched)
+
+    manifests = {}
+    for entry, reporter, store, sort_by, hits_path, wait in zip(entries, reporters, stores, sort_bys, hits_paths,
+                                                                queue_waits):
+        manifest = build_manifest(tool_name, store.count, sort_by, db_names, hits_path, {}, finished - started,
+                                  job_timings(timer, usage, wait))
+        manifest["batch"] = {"id": batch_id, "jobs": len(entries)}
+        job_storage.write_manifest(entry["job_id"], manifest)
+        task.backend.store_result(entry["job_id"], manifest, "SUCCESS")
+        reporter.emit("completed", result=manifest)
+        metrics.observe_job(tool_name, manifest)
+        manifests[entry["job_id"]] = manifest
+    return manifests
 
 @celery_app.task(name="tasks.run_blast", bind=True)
 def run_blast(self, query_path: str, db_paths: list, options: dict = None):
@@ -30,31 +342,13 @@ def run_blast(self, query_path: str, db_paths: list, options: dict = None):
     logger.info(f"Starting BLAST job: query={query_path}, dbs={db_paths}")
     
     try:
-        tool = tools["blast"]
-        all_hits = []
-        
-        for db_path in db_paths:
-            result_path = tool.search(query_path, db_path, options)
-            hits = tool.parse_result(result_path)
-            # 添加来源数据库标记
-            db_name = os.path.basename(db_path)
-            for hit in hits:
-                hit['database'] = db_name
-            all_hits.extend(hits)
-        
-        # 按分数排序
-        all_hits.sort(key=lambda x: x.get('bitscore', 0), reverse=True)
-        
-        return {
-            "status": "completed",
-            "tool": "blast",
-            "hits_count": len(all_hits),
-            "hits": all_hits[:100],  # 限制返回数量避免数据过大
-            "databases": [os.path.basename(p) for p in db_paths]
-        }
+        return run_search(self.request.id, "blast", query_path, db_paths, options, task=self,
+                          queue_wait=metrics.queue_wait(self.request))
     except Exception as e:
         logger.error(f"BLAST job failed: {str(e)}")
+        metrics.observe_failure("blast")
         self.update_state(state='FAILURE', meta={'error': str(e)})
+        publish_event(self.request.id, {"event": "failed", "job_id": self.request.id, "error": str(e)})
         raise
 
 @celery_app.task(name="tasks.run_minimap2", bind=True)
@@ -64,38 +358,93 @@ def run_minimap2(self, query_path: str, db_paths: list, options: dict = None):
     logger.info(f"Starting Minimap2 job: query={query_path}, dbs={db_paths}")
     
     try:
-        tool = tools["minimap2"]
-        all_hits = []
-        
-        for db_path in db_paths:
-            result_path = tool.search(query_path, db_path, options)
-            hits = tool.parse_result(result_path)
-            # 添加来源数据库标记
-            db_name = os.path.basename(db_path)
-            for hit in hits:
-                hit['database'] = db_name
-            all_hits.extend(hits)
-        
-        # 按 mapping quality 排序
-        all_hits.sort(key=lambda x: x.get('mapq', 0), reverse=True)
-        
-        return {
-            "status": "completed",
-            "tool": "minimap2",
-            "hits_count": len(all_hits),
-            "hits": all_hits[:100],
-            "databases": [os.path.basename(p) for p in db_paths]
-        }
+        return run_search(self.request.id, "minimap2", query_path, db_paths, options, task=self,
+                          queue_wait=metrics.queue_wait(self.request))
     except Exception as e:
         logger.error(f"Minimap2 job failed: {str(e)}")
+        metrics.observe_failure("minimap2")
         self.update_state(state='FAILURE', meta={'error': str(e)})
+        publish_event(self.request.id, {"event": "failed", "job_id": self.request.id, "error": str(e)})
         raise
 
+@celery_app.task(name="tasks.run_batch", bind=True)
+def run_batch(self, tool_name: str, db_paths: list, key: str, queue: str = None):
+    """取出一个批次的任务合并比对，队列中剩余的任务在下一个等待窗口后处理"""
+    # 先清除调度标记再取批次: 取批次之后入队的任务会由提交接口重新调度
+    batching.release_flush(key)
+    entries, remaining = batching.take_batch(key)
+    if remaining and batching.claim_flush(key):
+        run_batch.apply_async((tool_name, db_paths, key, queue), countdown=batching.BATCH_WINDOW_MS / 1000,
+                              queue=queue)
+    if not entries:
+        return {"jobs": 0}
+    logger.info(f"Starting {tool_name} batch of {len(entries)} jobs, dbs={db_paths}")
+
+    try:
+        if len(entries) == 1:
+            entry = entries[0]
+            wait = time.time() - entry["submitted_at"] if entry.get("submitted_at") else None
+            manifest = run_search(entry["job_id"], tool_name, entry["query_path"], db_paths, entry["options"], task=self,
+                                  queue_wait=wait)
+            self.backend.store_result(entry["job_id"], manifest, "SUCCESS")
+        else:
+            run_batched_search(self.request.id, tool_name, db_paths, entries, task=self)
+    except Exception as e:
+        logger.error(f"{tool_name} batch failed: {str(e)}")
+        for entry in entries:
+            metrics.observe_failure(tool_name)
+            self.backend.mark_as_failure(entry["job_id"], e)
+            publish_event(entry["job_id"], {"event": "failed", "job_id": entry["job_id"], "error": str(e)})
+        raise
+    return {"jobs": len(entries)}
+
+@celery_app.task(name="tasks.align_fast")
+def align_fast(records: list, db_paths: list, options: dict = None):
+    """快速通道: 在 worker 进程内用 mappy 比对内存中的短序列，直接返回排序后的前 top_k 个命中
+
+    不写查询文件、PAF 与命中存储，也不产生任务目录；索引来自 worker 常驻的索引缓存。
+    """
+    options = options or {}
+    started = time.perf_counter()
+    sort_by = options.get("sort_by") or DEFAULT_SORT_BY["minimap2"]
+    top = TopK(resolve_top_k(options), sort_by)
+    for db_path in db_paths:
+        db_name = os.path.basename(db_path)
+        for hit in fast_tool.align([tuple(r) for r in records], db_path, options):
+            hit["database"] = db_name
+            hit["identity"] = round(hit_identity(hit), 2)
+            top.push(hit)
+    return {
+        "tool": "minimap2",
+        "total": top.count,
+        "hits": top.results(),
+        "seconds": round(time.perf_counter() - started, 4),
+    }
+
+@celery_app.task(bind=True, name="tasks.build_indexes")
+def build_indexes(self, fasta_path: str, targets: list, force: bool = False):
+    """并行构建参考序列的多个索引，已是最新的目标跳过；进度为各目标状态"""
+    logger.info(f"Indexing {fasta_path}: {', '.join(targets)}")
+    task_id = self.request.id
+
+    def on_progress(states):
+        self.update_state(task_id=task_id, state="PROGRESS", meta={"targets": states})
+
+    states = indexing.build_indexes(fasta_path, targets, force, on_progress)
+    failed = any(state == "failed" for state in states.values())
+    return {"status": "failed" if failed else "completed", "path": fasta_path, "targets": states}
+
 @celery_app.task(name="tasks.index_database")
 def index_database(fasta_path: str, tool_name: str, output_path: str):
-    logger.info(f"Indexing database: {fasta_path} using {tool_name}")
+    """兼容旧调用: 构建单个工具的通用索引及 .fai，output_path 由索引流水线决定"""
     if tool_name not in tools:
         return {"status": "error", "message": f"Tool {tool_name} not supported"}
-    
-    success = tools[tool_name].index(fasta_path, output_path)
-    return {"status": "completed" if success else "failed", "path": output_path}
+    states = indexing.build_indexes(fasta_path, [tool_name, "faidx"])
+    return {"status": "completed" if states[tool_name] != "failed" else "failed", "path": output_path}
+
+@celery_app.task(name="tasks.cleanup_results")
+def cleanup_results():
+    """按保留时长与容量上限清理任务目录、上传文件和结果缓存，删除的任务同时删除 Celery 结果"""
+    report = retention.collect(forget=celery_app.backend.forget)
+    logger.info(f"Storage cleanup: {report}")
+    return report
@@ -0,0 +1,30 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hit_store import HitStoreWriter, query_hits
+
+
+def _write_blast_hits(path, evalues):
+    with HitStoreWriter(path, "blast") as writer:
+        for i, evalue in enumerate(evalues):
+            writer.add({"database": "db", "qseqid": f"q{i}", "pident": 90.0, "evalue": evalue, "bitscore": 50.0})
+
+
+def test_evalue_sorts_ascending_by_default(tmp_path):
+    path = str(tmp_path / "hits.sqlite")
+    _write_blast_hits(path, [1e-05, 5.0, 1e-50])
+
+    page = query_hits(path, sort_by="evalue")
+
+    assert [hit["evalue"] for hit in page["hits"]] == [1e-50, 1e-05, 5.0]
+
+
+def test_explicit_order_overrides_default(tmp_path):
+    path = str(tmp_path / "hits.sqlite")
+    _write_blast_hits(path, [1e-05, 5.0, 1e-50])
+
+    page = query_hits(path, sort_by="evalue", order="desc")
+
+    assert [hit["evalue"] for hit in page["hits"]] == [5.0, 1e-05, 1e-50]
@@ -1,18 +1,72 @@
+import os
+import subprocess
+import threading
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any
+from contextlib import contextmanager
+from typing import List, Dict, Any, Iterator, Optional
+
+_usage = threading.local()
+
+
+@contextmanager
+def collect_usage():
+    """Accumulates CPU time and peak RSS of commands started with run_command in this thread."""
+    usage = {"cpu_seconds": 0.0, "max_rss_mb": 0.0}
+    previous = getattr(_usage, "current", None)
+    _usage.current = usage
+    try:
+        yield usage
+    finally:
+        _usage.current = previous
+
+
+def run_command(cmd: List[str], stdout=None) -> None:
+    """Like subprocess.run(cmd, check=True), reaping the child with wait4 to read its own rusage.
+
+    RUSAGE_CHILDREN cannot be used here: searches for several databases run
+    concurrently in one worker process.
+    """
+    proc = subprocess.Popen(cmd, stdout=stdout)
+    try:
+        _, status, rusage = os.wait4(proc.pid, 0)
+    except BaseException:
+        proc.kill()
+        proc.wait()
+        raise
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    usage = getattr(_usage, "current", None)
+    if usage is not None:
+        usage["cpu_seconds"] += rusage.ru_utime + rusage.ru_stime
+        # ru_maxrss is in KB on Linux
+        usage["max_rss_mb"] = max(usage["max_rss_mb"], rusage.ru_maxrss / 1024)
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+
 
 class AlignmentTool(ABC):
+    # Suffix appended to the database name for this tool's result files
+    result_suffix: str = ""
+    # Suffixes of the index files built next to the reference FASTA
+    index_suffixes: tuple = ()
+
     @abstractmethod
-    def index(self, fasta_path: str, output_path: str) -> bool:
+    def index(self, fasta_path: str, output_path: str, options: Optional[Dict[str, Any]] = None) -> bool:
         """Create index for the reference fasta."""
         pass
     
     @abstractmethod
-    def search(self, query_path: str, db_path: str, options: Dict[str, Any]) -> str:
-        """Run search/alignment and return path to result file."""
+    def search(self, query_path: str, db_path: str, options: Dict[str, Any], output_path: str) -> str:
+        """Run search/alignment, write the result to output_path and return it."""
         pass
     
     @abstractmethod
     def parse_result(self, result_path: str) -> List[Dict[str, Any]]:
         """Parse result file into a structured list of hits."""
         pass
+
+    def iter_hits(self, result_path: str, options: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        """Yield hits one at a time. Tools that can stream their output override this.
+
+        options carries the job's hit filters for tools that support them.
+        """
+        return iter(self.parse_result(result_path))
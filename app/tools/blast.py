@@ -1,11 +1,25 @@
+import logging
 import subprocess
-import json
 import os
-from typing import List, Dict, Any
-from .base import AlignmentTool
+from typing import List, Dict, Any, Iterator, Optional
+from .base import AlignmentTool, run_command
+
+logger = logging.getLogger(__name__)
+
+# Tabular output columns requested from BLAST. stitle goes last because it
+# is the only free-text field.
+OUTFMT_COLUMNS = [
+    "qseqid", "qlen", "sseqid", "pident", "length", "mismatch", "gapopen",
+    "qstart", "qend", "sstart", "send", "evalue", "bitscore", "stitle",
+]
+INT_COLUMNS = {"qlen", "length", "mismatch", "gapopen", "qstart", "qend", "sstart", "send"}
+FLOAT_COLUMNS = {"pident", "evalue", "bitscore"}
 
 class BlastTool(AlignmentTool):
-    def index(self, fasta_path: str, output_path: str) -> bool:
+    result_suffix = ".blast.tsv"
+    index_suffixes = (".nin", ".nhr", ".nsq", ".ndb")
+
+    def index(self, fasta_path: str, output_path: str, options: Optional[Dict[str, Any]] = None) -> bool:
         """Runs makeblastdb."""
         # Determine dbtype (nucl or prot)
         # For simplicity, we assume nucl for now
@@ -21,87 +35,79 @@ class BlastTool(AlignmentTool):
         except subprocess.CalledProcessError:
             return False
 
-    def search(self, query_path: str, db_path: str, options: Dict[str, Any]) -> str:
-        """Runs blastn and returns the path to the JSON output."""
+    def search(self, query_path: str, db_path: str, options: Dict[str, Any], output_path: str) -> str:
+        """Runs blastn and returns the path to the tabular output."""
         program = options.get("program", "blastn")
-        output_path = query_path + ".blast.json"
         
         cmd = [
             program,
             "-query", query_path,
             "-db", db_path,
-            "-outfmt", "15",
+            "-outfmt", "6 " + " ".join(OUTFMT_COLUMNS),
             "-out", output_path
         ]
         
         # Add optional parameters
         if "evalue" in options:
             cmd.extend(["-evalue", str(options["evalue"])])
+        if "threads" in options:
+            cmd.extend(["-num_threads", str(options["threads"])])
         
         # Always set task parameter, default to blastn
         task = options.get("task", "blastn")
         cmd.extend(["-task", str(task)])
             
-        print(f"DEBUG: Running BLAST command: {' '.join(cmd)}")
-        subprocess.run(cmd, check=True)
+        logger.debug(f"Running BLAST command: {' '.join(cmd)}")
+        run_command(cmd)
         return output_path
 
-    def parse_result(self, result_path: str) -> List[Dict[str, Any]]:
-        """Parses BLAST JSON output."""
+    def fetch_region(self, db_path: str, seqid: str, start: int, end: int, strand: str = "plus") -> str:
+        """Extracts a 1-based inclusive region with blastdbcmd.
+
+        Looking up seqid requires a database built with -parse_seqids.
+        """
+        cmd = [
+            "blastdbcmd",
+            "-db", db_path,
+            "-entry", seqid,
+            "-range", f"{start}-{end}",
+            "-strand", strand,
+            "-outfmt", "%s",
+        ]
+        result = subprocess.run(cmd, check=True, capture_output=True, text=True)
+        return "".join(result.stdout.split())
+
+    def iter_hits(self, result_path: str, options: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        """Streams hits from BLAST tabular output one line at a time."""
         if not os.path.exists(result_path):
-            return []
-            
+            return
+
+        n_cols = len(OUTFMT_COLUMNS)
         with open(result_path, 'r') as f:
-            data = json.load(f)
-            
-        hits = []
-        try:
-            blast_outputs = data.get("BlastOutput2", [])
-            for output in blast_outputs:
-                search_results = output.get("report", {}).get("results", {}).get("search", {})
-                query_title = search_results.get("query_title", "Unknown")
-                query_len = search_results.get("query_len", 0)
-                hits_raw = search_results.get("hits", [])
-                for h in hits_raw:
-                    description = h.get("description", [{}])[0]
-                    hsps = h.get("hsps", [{}])
-                    for hsp in hsps:
-                        align_len = hsp.get("align_len", 0)
-                        identity = hsp.get("identity", 0)
-                        gaps = hsp.get("gaps", 0)
-                        # Calculate pident (percentage identity)
-                        pident = round((identity / align_len * 100), 2) if align_len > 0 else 0
-                        # Calculate mismatch = align_len - identity - gaps
-                        mismatch = align_len - identity - gaps if align_len > 0 else 0
-                        
-                        # Improved sseqid parsing
-                        # Priority: title (original FASTA header) > id > accession
-                        # Note: id like "gnl|BL_ORD_ID|0" and accession "0" are BLAST internal IDs
-                        title = description.get("title", "")
-                        sseqid = title.split()[0] if title else ""
-                        if not sseqid:
-                            # Fallback to id/accession if title is empty
-                            sseqid = description.get("id") or description.get("accession") or "Unknown"
-                        
-                        hits.append({
-                            # outfmt 6 standard columns
-                            "qseqid": query_title,
-                            "sseqid": sseqid,
-                            "pident": pident,
-                            "length": align_len,
-                            "mismatch": mismatch,
-                            "gapopen": gaps,
-                            "qstart": hsp.get("query_from"),
-                            "qend": hsp.get("query_to"),
-                            "sstart": hsp.get("hit_from"),
-                            "send": hsp.get("hit_to"),
-                            "evalue": hsp.get("evalue"),
-                            "bitscore": hsp.get("bit_score"),
-                            # Extra fields for display
-                            "stitle": description.get("title", ""),
-                            "qlen": query_len,
-                        })
-        except (KeyError, IndexError):
-            pass
-            
-        return hits
+            for line in f:
+                if not line.strip() or line.startswith("#"):
+                    continue
+                cols = line.rstrip("\n").split("\t")
+                if len(cols) < n_cols:
+                    continue
+
+                hit: Dict[str, Any] = {}
+                for name, value in zip(OUTFMT_COLUMNS, cols):
+                    if name in INT_COLUMNS:
+                        hit[name] = int(value)
+                    elif name in FLOAT_COLUMNS:
+                        hit[name] = float(value)
+                    else:
+                        hit[name] = value
+                hit["pident"] = round(hit["pident"], 2)
+
+                # Prefer the original FASTA header over BLAST internal ids
+                # such as "gnl|BL_ORD_ID|0" for databases built without -parse_seqids
+                title = hit["stitle"]
+                if title and title != "N/A":
+                    hit["sseqid"] = title.split()[0]
+                yield hit
+
+    def parse_result(self, result_path: str) -> List[Dict[str, Any]]:
+        """Parses BLAST tabular output."""
+        return list(self.iter_hits(result_path))
@@ -0,0 +1,95 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+try:
+    import mappy
+except ImportError:  # mappy is optional; without it searches fall back to the minimap2 CLI
+    mappy = None
+
+# Memory budget for resident indexes in MB. 0 disables the cache.
+MM2_INDEX_CACHE_MB = int(os.getenv("MM2_INDEX_CACHE_MB", "0"))
+
+
+class IndexCache:
+    """Worker-resident LRU cache of mappy aligners, bounded by a memory budget.
+
+    The in-memory size of a minimap2 index is close to the size of its .mmi
+    file, so that is what is charged against the budget. Entries are keyed on
+    the index file's mtime and size as well as its path, so a rebuilt index is
+    loaded afresh and the stale aligner dropped. Indexes load outside the
+    cache-wide lock, one loader per key: other threads keep using cached
+    aligners while a large index is read.
+    """
+
+    def __init__(self, budget_bytes: int):
+        self.budget_bytes = budget_bytes
+        self._aligners: "OrderedDict[Tuple[str, Optional[str], int, int], Tuple[object, int]]" = OrderedDict()
+        self._loading: Dict[Tuple[str, Optional[str], int, int], threading.Lock] = {}
+        self._used_bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return mappy is not None and self.budget_bytes > 0
+
+    def _cached(self, key):
+        entry = self._aligners.get(key)
+        if entry is None:
+            return None
+        self._aligners.move_to_end(key)
+        return entry[0]
+
+    def get(self, index_path: str, preset: Optional[str] = None):
+        """Return a loaded aligner for the index, or None if it cannot be cached."""
+        if not self.enabled:
+            return None
+        st = os.stat(index_path)
+        key = (index_path, preset, st.st_mtime_ns, st.st_size)
+        with self._lock:
+            aligner = self._cached(key)
+            if aligner is not None:
+                return aligner
+            if st.st_size > self.budget_bytes:
+                return None
+            loading = self._loading.setdefault(key, threading.Lock())
+
+        with loading:
+            # Another thread may have loaded it while this one waited
+            with self._lock:
+                aligner = self._cached(key)
+            if aligner is not None:
+                return aligner
+            try:
+                aligner = mappy.Aligner(index_path, preset=preset)
+                if not aligner:
+                    return None
+                with self._lock:
+                    for stale in [k for k in self._aligners if k[:2] == key[:2]]:
+                        self._used_bytes -= self._aligners.pop(stale)[1]
+                    while self._aligners and self._used_bytes + st.st_size > self.budget_bytes:
+                        _, (_, evicted_size) = self._aligners.popitem(last=False)
+                        self._used_bytes -= evicted_size
+                    self._aligners[key] = (aligner, st.st_size)
+                    self._used_bytes += st.st_size
+                return aligner
+            finally:
+                with self._lock:
+                    self._loading.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._aligners.clear()
+            self._used_bytes = 0
+
+
+index_cache = IndexCache(MM2_INDEX_CACHE_MB * 1024 * 1024)
+
+
+def write_paf(aligner, query_path: str, output_path: str) -> None:
+    """Map every query sequence with a mappy aligner and write minimap2 -c style PAF."""
+    with open(output_path, "w") as f:
+        for name, seq, _ in mappy.fastx_read(query_path):
+            for hit in aligner.map(seq):
+                f.write(f"{name}\t{len(seq)}\t{hit}\tNM:i:{hit.NM}\n")
@@ -0,0 +1,87 @@
+import os
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+from .minimap2 import Minimap2Tool
+from .index_cache import index_cache, mappy, write_paf
+
+
+class MappyTool(Minimap2Tool):
+    """minimap2 through the mappy bindings, aligning in-process without a subprocess or PAF file.
+
+    Index resolution and PAF parsing are shared with Minimap2Tool, so results
+    match the CLI. Aligners for prebuilt .mmi indexes come from the
+    worker-resident index cache when it is enabled; otherwise each call loads
+    the index or builds it from the FASTA. Every method raises
+    RuntimeError when mappy is not installed.
+    """
+
+    def _aligner(self, db_path: str, options: Dict[str, Any]):
+        if mappy is None:
+            raise RuntimeError("mappy is not installed")
+        preset = options.get("preset")
+        target = self.resolve_index(db_path, options)
+        # Only prebuilt .mmi files are cached: the cache charges file size, which badly
+        # underestimates an index built from the FASTA, and k/w only apply to the latter
+        aligner = index_cache.get(target, preset) if target != db_path else None
+        if aligner is None:
+            custom = {name: int(options[name]) for name in ("k", "w") if name in options and target == db_path}
+            aligner = mappy.Aligner(target, preset=preset, **custom)
+            if not aligner:
+                raise RuntimeError(f"Cannot load minimap2 index for {db_path}")
+        return aligner
+
+    def preload(self, db_path: str, preset: Optional[str] = None) -> bool:
+        """Load the prebuilt index for db_path into the resident cache, returning whether it is cached."""
+        target = self.resolve_index(db_path, {"preset": preset})
+        if not index_cache.enabled or target == db_path:
+            return False
+        return index_cache.get(target, preset) is not None
+
+    def index(self, fasta_path: str, output_path: str, options: Optional[Dict[str, Any]] = None) -> bool:
+        """Builds a .mmi with mappy, written to a temporary file and renamed into place."""
+        if mappy is None:
+            raise RuntimeError("mappy is not installed")
+        tmp_path = output_path + ".tmp"
+        try:
+            if not mappy.Aligner(fasta_path, preset=(options or {}).get("preset"), fn_idx_out=tmp_path):
+                return False
+            os.replace(tmp_path, output_path)
+            return True
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def search(self, query_path: str, db_path: str, options: Dict[str, Any], output_path: str) -> str:
+        """Maps every query with mappy and writes minimap2 -c style PAF."""
+        write_paf(self._aligner(db_path, options), query_path, output_path)
+        return output_path
+
+    def align(self, records: List[Tuple[str, str]], db_path: str,
+              options: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """Maps in-memory (name, sequence) records and yields hits shaped like Minimap2Tool.iter_hits."""
+        aligner = self._aligner(db_path, options)
+        min_mapq = int(options.get("min_mapq") or 0)
+        primary_only = bool(options.get("primary_only"))
+        for name, seq in records:
+            for hit in aligner.map(seq):
+                if hit.mapq < min_mapq or (primary_only and not hit.is_primary):
+                    continue
+                yield {
+                    "query_name": name,
+                    "query_len": len(seq),
+                    "query_start": hit.q_st,
+                    "query_end": hit.q_en,
+                    "strand": "+" if hit.strand > 0 else "-",
+                    "target_name": hit.ctg,
+                    "target_len": hit.ctg_len,
+                    "target_start": hit.r_st,
+                    "target_end": hit.r_en,
+                    "matches": hit.mlen,
+                    "block_len": hit.blen,
+                    "mapq": hit.mapq,
+                    "nm": hit.NM,
+                    # mappy does not expose the DP score or per-base divergence
+                    "aln_score": None,
+                    "tp": "P" if hit.is_primary else "S",
+                    "divergence": None,
+                    "cigar": hit.cigar_str,
+                }
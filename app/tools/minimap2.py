@@ -1,73 +1,219 @@
 import subprocess
 import os
-from typing import List, Dict, Any
-from .base import AlignmentTool
+import struct
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+from .base import AlignmentTool, run_command
+from .index_cache import index_cache, write_paf
+
+MMI_MAGIC = b"MMI\x02"
+
+# Index flag bits from minimap2's mmpriv.h
+MM_I_HPC = 0x1
+MM_I_NO_SEQ = 0x2
+
+# (k, w, homopolymer-compressed) used by each preset when building an index.
+# Presets not listed here fall back to the default (map-ont) parameters.
+PRESET_INDEX_PARAMS = {
+    "map-ont": (15, 10, False),
+    "map-pb": (19, 10, True),
+    "map-hifi": (19, 19, False),
+    "lr:hq": (19, 19, False),
+    "asm5": (19, 19, False),
+    "asm10": (19, 19, False),
+    "asm20": (19, 10, False),
+    "sr": (21, 11, False),
+    "splice": (15, 5, False),
+    "splice:hq": (15, 5, False),
+    "ava-ont": (15, 5, False),
+    "ava-pb": (19, 5, True),
+}
+DEFAULT_INDEX_PARAMS = PRESET_INDEX_PARAMS["map-ont"]
+
+
+# PAF optional tags kept on each hit: field -> (tag prefix, converter)
+PAF_TAGS = {
+    "nm": ("\tNM:i:", int),            # edit distance (mismatches + gap bases)
+    "aln_score": ("\tAS:i:", int),     # DP alignment score
+    "tp": ("\ttp:A:", str),            # alignment type
+    "divergence": ("\tde:f:", float),  # gap-compressed per-base divergence
+    "cigar": ("\tcg:Z:", str),
+}
+
+
+def _paf_tag(tags: str, prefix: str) -> Optional[str]:
+    start = tags.find(prefix)
+    if start < 0:
+        return None
+    start += len(prefix)
+    end = tags.find("\t", start)
+    return tags[start:end] if end >= 0 else tags[start:]
+
+
+def preset_index_path(fasta_path: str, preset: Optional[str] = None) -> str:
+    """<fasta>.mmi for the generic index, <fasta>.<preset>.mmi for a preset-specific one."""
+    if not preset:
+        return fasta_path + ".mmi"
+    return f"{fasta_path}.{preset.replace(':', '_')}.mmi"
+
+
+def iter_paf(result_path: str, min_mapq: int = 0, primary_only: bool = False) -> Iterator[Dict[str, Any]]:
+    """Streams PAF lines as hit dicts.
+
+    Only the 12 mandatory columns are split; the tags in PAF_TAGS are looked up
+    in the remaining text, and the CIGAR stays in its run-length cg:Z: form.
+    The mapping quality and tp tag are checked first so filtered lines never
+    pay for the remaining conversions or the dict.
+    """
+    nm_tag, as_tag, tp_tag, de_tag, cg_tag = (PAF_TAGS[name][0] for name in
+                                              ("nm", "aln_score", "tp", "divergence", "cigar"))
+    with open(result_path, "r") as f:
+        for line in f:
+            cols = line.rstrip("\n").split("\t", 12)
+            if len(cols) < 12:
+                continue
+            mapq = int(cols[11])
+            if mapq < min_mapq:
+                continue
+            # Leading tab anchors every tag lookup at a field boundary
+            tags = "\t" + cols[12] if len(cols) > 12 else ""
+            tp = _paf_tag(tags, tp_tag)
+            # tp:A:P primary (including supplementary), S secondary, I/i inversion
+            if primary_only and tp not in (None, "P"):
+                continue
+
+            nm = _paf_tag(tags, nm_tag)
+            score = _paf_tag(tags, as_tag)
+            de = _paf_tag(tags, de_tag)
+            qlen, qstart, qend = map(int, cols[1:4])
+            tlen, tstart, tend, matches, block_len = map(int, cols[6:11])
+            yield {
+                "query_name": cols[0],
+                "query_len": qlen,
+                "query_start": qstart,
+                "query_end": qend,
+                "strand": cols[4],
+                "target_name": cols[5],
+                "target_len": tlen,
+                "target_start": tstart,
+                "target_end": tend,
+                "matches": matches,
+                "block_len": block_len,
+                "mapq": mapq,
+                "nm": None if nm is None else int(nm),
+                "aln_score": None if score is None else int(score),
+                "tp": tp,
+                "divergence": None if de is None else float(de),
+                "cigar": _paf_tag(tags, cg_tag),
+            }
+
+
+def read_index_params(mmi_path: str) -> Optional[Tuple[int, int, int]]:
+    """Read (k, w, flag) from a .mmi header, or None if it is not a minimap2 index."""
+    try:
+        with open(mmi_path, "rb") as f:
+            header = f.read(24)
+    except OSError:
+        return None
+    if len(header) < 24 or header[:4] != MMI_MAGIC:
+        return None
+    # Header layout: magic, then uint32 w, k, b, n_seq, flag
+    w, k, _, _, flag = struct.unpack("<5I", header[4:24])
+    return k, w, flag
+
 
 class Minimap2Tool(AlignmentTool):
-    def index(self, fasta_path: str, output_path: str) -> bool:
-        """Runs minimap2 -d."""
-        cmd = ["minimap2", "-d", output_path, fasta_path]
+    result_suffix = ".mm2.paf"
+    index_suffixes = (".mmi",)
+
+    def index(self, fasta_path: str, output_path: str, options: Optional[Dict[str, Any]] = None) -> bool:
+        """Runs minimap2 -d, with -x when a preset is given.
+
+        The index is written to a temporary file and renamed into place so
+        running searches never see a partial .mmi.
+        """
+        preset = (options or {}).get("preset")
+        tmp_path = output_path + ".tmp"
+        cmd = ["minimap2"]
+        if preset:
+            cmd.extend(["-x", preset])
+        cmd.extend(["-d", tmp_path, fasta_path])
         try:
             subprocess.run(cmd, check=True, capture_output=True)
+            os.replace(tmp_path, output_path)
             return True
         except subprocess.CalledProcessError:
             return False
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def resolve_index(self, db_path: str, options: Dict[str, Any]) -> str:
+        """Return a prebuilt .mmi for db_path if one is usable, otherwise db_path itself.
 
-    def search(self, query_path: str, db_path: str, options: Dict[str, Any]) -> str:
+        The preset-specific index (<fasta>.<preset>.mmi) is tried before the
+        generic <fasta>.mmi. An index must be newer than the FASTA, keep the
+        reference sequences (needed for -c), and have been built with the
+        k/w/HPC settings the requested preset would use.
+        """
+        preset = options.get("preset")
+        exp_k, exp_w, exp_hpc = PRESET_INDEX_PARAMS.get(preset, DEFAULT_INDEX_PARAMS)
+        exp_k = int(options.get("k", exp_k))
+        exp_w = int(options.get("w", exp_w))
+
+        candidates = [preset_index_path(db_path, preset)] if preset else []
+        candidates.append(preset_index_path(db_path))
+        for mmi_path in candidates:
+            if not os.path.exists(mmi_path):
+                continue
+            if os.path.exists(db_path) and os.path.getmtime(mmi_path) < os.path.getmtime(db_path):
+                continue
+            params = read_index_params(mmi_path)
+            if params is None:
+                continue
+            k, w, flag = params
+            if (k, w, bool(flag & MM_I_HPC)) == (exp_k, exp_w, exp_hpc) and not flag & MM_I_NO_SEQ:
+                return mmi_path
+        return db_path
+
+    def search(self, query_path: str, db_path: str, options: Dict[str, Any], output_path: str) -> str:
         """Runs minimap2 and returns the path to the PAF output."""
-        output_path = query_path + ".mm2.paf"
-        
+        target = self.resolve_index(db_path, options)
+        preset = options.get("preset")
+
+        # Reuse a resident index when the worker cache is enabled
+        if target != db_path:
+            aligner = index_cache.get(target, preset)
+            if aligner is not None:
+                write_paf(aligner, query_path, output_path)
+                return output_path
+
         # Use -c for PAF output with CIGAR
-        cmd = ["minimap2", "-c", db_path, query_path]
+        cmd = ["minimap2", "-c", target, query_path]
         
         # Add presets if provided
-        preset = options.get("preset")
         if preset:
             cmd.extend(["-x", preset])
+        if "threads" in options:
+            cmd.extend(["-t", str(options["threads"])])
+        # k/w only take effect when indexing the FASTA on the fly
+        if target == db_path:
+            if "k" in options:
+                cmd.extend(["-k", str(options["k"])])
+            if "w" in options:
+                cmd.extend(["-w", str(options["w"])])
             
         with open(output_path, "w") as f:
-            subprocess.run(cmd, stdout=f, check=True)
+            run_command(cmd, stdout=f)
             
         return output_path
 
+    def iter_hits(self, result_path: str, options: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        """Streams hits from PAF output, applying min_mapq / primary_only before building each hit."""
+        if not os.path.exists(result_path):
+            return
+        options = options or {}
+        yield from iter_paf(result_path, int(options.get("min_mapq") or 0), bool(options.get("primary_only")))
+
     def parse_result(self, result_path: str) -> List[Dict[str, Any]]:
         """Parses Minimap2 PAF output."""
-        if not os.path.exists(result_path):
-            return []
-            
-        hits = []
-        with open(result_path, 'r') as f:
-            for line in f:
-                cols = line.strip().split('\t')
-                if len(cols) < 12:
-                    continue
-                
-                # PAF format columns:
-                # 0: Query seq name
-                # 1: Query seq len
-                # 2: Query start
-                # 3: Query end
-                # 4: Relative strand
-                # 5: Target seq name
-                # 6: Target seq len
-                # 7: Target start
-                # 8: Target end
-                # 9: Number of residues match
-                # 10: Alignment block length
-                # 11: Mapping quality
-                
-                hits.append({
-                    "query_name": cols[0],
-                    "query_len": int(cols[1]),
-                    "query_start": int(cols[2]),
-                    "query_end": int(cols[3]),
-                    "strand": cols[4],
-                    "target_name": cols[5],
-                    "target_len": int(cols[6]),
-                    "target_start": int(cols[7]),
-                    "target_end": int(cols[8]),
-                    "matches": int(cols[9]),
-                    "block_len": int(cols[10]),
-                    "mapq": int(cols[11])
-                })
-        return hits
+        return list(self.iter_hits(result_path))
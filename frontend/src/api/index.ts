@@ -1,5 +1,5 @@
 import axios from 'axios';
-import type { Database, ToolInfo, JobStatus } from '../types';
+import type { Database, ToolInfo, JobStatus, HitPage, HitQuery, Region, RegionQuery } from '../types';
 
 const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000';
 
@@ -40,4 +40,18 @@ export const api = {
         const { data } = await client.get(`/api/jobs/${jobId}`);
         return data;
     },
+
+    jobEventsUrl(jobId: string): string {
+        return `${API_URL}/api/jobs/${jobId}/events`;
+    },
+
+    async getJobHits(jobId: string, query: HitQuery = {}): Promise<HitPage> {
+        const { data } = await client.get(`/api/jobs/${jobId}/hits`, { params: query });
+        return data;
+    },
+
+    async getRegion(dbId: string, query: RegionQuery): Promise<Region> {
+        const { data } = await client.get(`/api/databases/${encodeURIComponent(dbId)}/region`, { params: query });
+        return data;
+    },
 };
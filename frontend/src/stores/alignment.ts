@@ -33,6 +33,7 @@ export const useAlignmentStore = defineStore('alignment', {
 
         async submitAlignment(input: File | string, dbIds: string[], tool: string, options: any = {}) {
             this.loading = true;
+            this.error = null;
             try {
                 let job;
                 if (typeof input === 'string') {
@@ -57,22 +58,69 @@ export const useAlignmentStore = defineStore('alignment', {
                 this.activeJobs.push(job);
                 return job;
             } catch (err: any) {
-                this.error = 'Failed to submit job';
+                // 上传或提交时的格式校验错误直接展示给用户
+                this.error = err.response?.data?.detail || 'Failed to submit job';
                 throw err;
             } finally {
                 this.loading = false;
             }
         },
 
+        setJobStatus(job: JobStatus) {
+            const index = this.activeJobs.findIndex(j => j.job_id === job.job_id);
+            if (index !== -1) {
+                this.activeJobs[index] = job;
+            } else {
+                this.activeJobs.push(job);
+            }
+        },
+
+        // Apply one event from the job's Server-Sent Events stream
+        applyJobEvent(jobId: string, event: any) {
+            const current: JobStatus = this.activeJobs.find(j => j.job_id === jobId)
+                || { job_id: jobId, state: 'PENDING', status: null, result: null };
+
+            switch (event.event) {
+                case 'snapshot':
+                    this.setJobStatus({
+                        job_id: event.job_id,
+                        state: event.state,
+                        status: event.status,
+                        result: event.result,
+                        progress: event.progress,
+                    });
+                    break;
+                case 'completed':
+                    this.setJobStatus({ ...current, state: 'SUCCESS', result: event.result, progress: null });
+                    break;
+                case 'failed':
+                    this.setJobStatus({ ...current, state: 'FAILURE', status: event.error });
+                    break;
+                default: {
+                    const progress = {
+                        tool: event.tool ?? current.progress?.tool ?? '',
+                        databases: { ...(current.progress?.databases || {}) },
+                        hits_so_far: current.progress?.hits_so_far ?? 0,
+                        top_hits: current.progress?.top_hits ?? [],
+                        chunks: event.chunks ?? current.progress?.chunks,
+                    };
+                    for (const db of event.databases || []) progress.databases[db] = 'pending';
+                    if (event.event === 'database_started') progress.databases[event.database] = 'running';
+                    if (event.event === 'database_finished') progress.databases[event.database] = 'finished';
+                    if (event.hits_so_far !== undefined) progress.hits_so_far = event.hits_so_far;
+                    if (event.top_hits !== undefined) progress.top_hits = event.top_hits;
+                    if (event.event === 'chunk_finished' && progress.chunks) {
+                        progress.chunks = { ...progress.chunks, finished: progress.chunks.finished + 1 };
+                    }
+                    this.setJobStatus({ ...current, state: 'PROGRESS', progress });
+                }
+            }
+        },
+
         async fetchJobStatus(jobId: string) {
             try {
                 const job = await api.getJobStatus(jobId);
-                const index = this.activeJobs.findIndex(j => j.job_id === jobId);
-                if (index !== -1) {
-                    this.activeJobs[index] = job;
-                } else {
-                    this.activeJobs.push(job);
-                }
+                this.setJobStatus(job);
                 return job;
             } catch (err: any) {
                 this.error = 'Failed to fetch job status';
@@ -9,6 +9,12 @@ export interface Database {
     genome_version?: string;
     sequence_type?: string;  // 'cds' | 'protein' | 'genome' | 'transcript'
     description?: string;
+    // 序列统计 (建立 .fai 索引后可用)
+    sequence_count?: number | null;
+    total_length?: number | null;
+    max_length?: number | null;
+    n50?: number | null;
+    gc_percent?: number | null;
 }
 
 export interface ToolInfo {
@@ -16,11 +22,39 @@ export interface ToolInfo {
     description: string;
 }
 
+export interface JobProgress {
+    tool: string;
+    databases: Record<string, string>;  // pending | running | finished
+    hits_so_far: number;
+    top_hits: AlignmentHit[];
+    chunks?: { total: number; finished: number };  // database x query chunk units
+}
+
 export interface JobStatus {
     job_id: string;
     state: string;
     status: string | null;
     result: any | null;
+    progress?: JobProgress | null;
+}
+
+export interface HitPage {
+    tool: string;
+    total: number;
+    offset: number;
+    limit: number;
+    hits: AlignmentHit[];
+}
+
+export interface HitQuery {
+    offset?: number;
+    limit?: number;
+    sort_by?: string;
+    order?: 'asc' | 'desc';
+    database?: string;
+    qseqid?: string;
+    min_pident?: number;
+    max_evalue?: number;
 }
 
 export interface AlignmentHit {
@@ -54,6 +88,34 @@ export interface AlignmentHit {
     matches?: number;
     block_len?: number;
     mapq?: number;
+    // PAF tags (minimap2 -c)
+    nm?: number | null;          // NM: edit distance
+    aln_score?: number | null;   // AS: DP alignment score
+    tp?: string | null;          // P primary, S secondary, I/i inversion
+    divergence?: number | null;  // de: gap-compressed per-base divergence
+    cigar?: string | null;
     // Multi-db support
     database?: string;
+    // Identity (%) derived by the hit store for both tools
+    identity?: number;
+}
+
+// Reference region around a hit, 1-based inclusive coordinates
+export interface RegionQuery {
+    seqid: string;
+    start: number;
+    end: number;
+    strand?: '+' | '-';
+    flank?: number;
+}
+
+export interface Region {
+    seqid: string;
+    start: number | null;
+    end: number | null;
+    strand: string;
+    flank_left: number;
+    flank_right: number;
+    sequence: string | null;
+    error?: string | null;
 }